@@ -1,9 +1,22 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from models import db_drop_and_create_all, setup_db, Business, Customer
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from models import db_drop_and_create_all, setup_db, projected_query, db, business_geohash, Business, Customer, Product
 from auth import AuthError, requires_auth
+from pagination import page_args, paginate
+from streaming import wants_stream, stream_ndjson
+from serializers import json_response, serializer_for
+from cache import cached_listing, entity_cache, table_versions
+from bulk import BULK_MAX_ROWS, bulk_insert
+from search import search_args, search_businesses, near_args, near_businesses
+from geo import valid_coordinates
+from pool import pool_stats
+from slowlog import slow_query_log
+from writes import if_match_version, etag, update_returning, delete_returning
+import metrics
 
 def create_app(test_config=None):
   # create and configure the app
@@ -11,6 +24,8 @@ def create_app(test_config=None):
   CORS(app)
 
   setup_db(app)
+  # request, SQL and JWKS timings on GET /metrics when METRICS_ENABLED is set
+  metrics.install(app)
   
   # db_drop_and_create_all()
 
@@ -19,34 +34,100 @@ def create_app(test_config=None):
       return "OK"
 
 
-  @app.route('/businesses')
-  @requires_auth('get:businesses')
-  def get_businesses(payload):
-    businesses = Business.query.all()
-    businesses_formatted = [business.short() for business in businesses]
+  @app.route('/health')
+  def health():
+    # connection pool of this worker: in use / idle connections and checkout waits
+    return json_response({
+      'success': True,
+      'database': pool_stats(db.engine),
+      'status': 200
+    }), 200
 
-    if len(businesses) == 0:
-        abort(404)
-    
-    return jsonify({
+
+  @app.route('/admin/slow-queries')
+  @requires_auth('get:slow-queries')
+  def get_slow_queries(payload):
+    # statements over SLOW_QUERY_THRESHOLD_MS in this worker, newest first
+    if not slow_query_log.enabled:
+      abort(404)
+    return json_response({
+      'success': True,
+      'threshold_ms': slow_query_log.threshold_ms,
+      'queries': slow_query_log.entries(),
+      'status': 200
+    }), 200
+
+
+  @app.route('/admin/slow-queries', methods=['DELETE'])
+  @requires_auth('delete:slow-queries')
+  def delete_slow_queries(payload):
+    if not slow_query_log.enabled:
+      abort(404)
+    slow_query_log.clear()
+    return json_response({
       'success': True,
-      'businesses' : businesses_formatted,
       'status': 200
     }), 200
 
+
+  @app.route('/businesses')
+  @requires_auth('get:businesses')
+  def get_businesses(payload):
+    serializer = serializer_for(Business, 'short')
+    query = projected_query(Business, serializer.fields)
+    if wants_stream():
+      return stream_ndjson(query.order_by(Business.id), serializer.dumps_row)
+
+    limit, after = page_args()
+    include_products = request.args.get('include') == 'products'
+
+    def build_page():
+      if include_products:
+        # one query for the page and one for all of its products, not one per business
+        businesses, next_cursor = paginate(Business.query.options(selectinload(Business.products)),
+                                           Business.id, limit, after)
+        businesses_formatted = [dict(business.short(), products=[product.short() for product in business.products])
+                                for business in businesses]
+      else:
+        businesses, next_cursor = paginate(query, Business.id, limit, after)
+        businesses_formatted = serializer.to_dicts(businesses)
+
+      if len(businesses) == 0:
+          abort(404)
+
+      return {
+        'success': True,
+        'businesses' : businesses_formatted,
+        'next': next_cursor,
+        'status': 200
+      }
+
+    variant = (limit, after)
+    if include_products:
+      variant += ('products', table_versions.get(Product.__tablename__))
+    return cached_listing(Business.__tablename__, variant, build_page)
+
   
   @app.route('/businesses/<int:id>')
   @requires_auth('get:business-detail')
   def get_business_by_id(payload, id):
-    business = Business.query.filter(Business.id == id).one_or_none()
-    if business is None:
+    serializer = serializer_for(Business, 'long')
+
+    def load_business():
+      business = projected_query(Business, serializer.fields).filter(Business.id == id).one_or_none()
+      if business is None:
+        return None
+      return {
+        'success': True,
+        'customer' : serializer.to_dict(business),
+        'status': 200
+      }
+
+    body = entity_cache.get_or_load(Business, id, load_business)
+    if body is None:
         abort(404)
   
-    return jsonify({
-      'success': True,
-      'customer' : business.long(),
-      'status': 200
-    }), 200
+    return Response(body, mimetype='application/json'), 200
 
 
   @app.route('/customers', methods=['POST'])
@@ -65,10 +146,13 @@ def create_app(test_config=None):
       else:
         customer = Customer(id=id, name=name, address=address, phone=phone, email=email)
       customer.insert()
+      table_versions.bump(Customer.__tablename__)
+      # drops a cached 404 for the new id
+      entity_cache.invalidate(Customer, customer.id)
     except:
       abort(422)
         
-    return jsonify({
+    return json_response({
       'success': True,
       'business' : customer.long(),
       'status': 200
@@ -78,44 +162,62 @@ def create_app(test_config=None):
   @app.route('/customers')
   @requires_auth('get:customers')
   def get_customers(payload):
-    customers = Customer.query.all()
-    customers_formatted = [customer.short() for customer in customers]
+    serializer = serializer_for(Customer, 'short')
+    query = projected_query(Customer, serializer.fields)
+    if wants_stream():
+      return stream_ndjson(query.order_by(Customer.id), serializer.dumps_row)
 
-    if len(customers) == 0:
-        abort(400)
-  
-    return jsonify({
-      'success': True,
-      'customers' : customers_formatted,
-      'status': 200
-    }), 200
+    limit, after = page_args()
+
+    def build_page():
+      customers, next_cursor = paginate(query, Customer.id, limit, after)
+      customers_formatted = serializer.to_dicts(customers)
+
+      if len(customers) == 0:
+          abort(400)
+
+      return {
+        'success': True,
+        'customers' : customers_formatted,
+        'next': next_cursor,
+        'status': 200
+      }
+
+    return cached_listing(Customer.__tablename__, (limit, after), build_page)
 
   
 
   @app.route('/customers/<int:id>')
   @requires_auth('get:customer-detail')
   def get_customer_by_id(payload, id):
-    customer = Customer.query.filter(Customer.id == id).one_or_none()
-    if customer is None:
+    serializer = serializer_for(Customer, 'long')
+
+    def load_customer():
+      customer = projected_query(Customer, serializer.fields).filter(Customer.id == id).one_or_none()
+      if customer is None:
+        return None
+      return {
+        'success': True,
+        'customer' : serializer.to_dict(customer),
+        'status': 200
+      }
+
+    body = entity_cache.get_or_load(Customer, id, load_customer)
+    if body is None:
         abort(404)
   
-    return jsonify({
-      'success': True,
-      'customer' : customer.long(),
-      'status': 200
-    }), 200
+    return Response(body, mimetype='application/json'), 200
 
   @app.route('/customers/<int:id>', methods=['DELETE'])
   @requires_auth('delete:customer')
   def delete_customer(payolad, id):
-    customer = Customer.query.filter(Customer.id == id).one_or_none()
-
-    if customer is None:
+    # one DELETE, conditional on the version sent in If-Match
+    if delete_returning(Customer, id, if_match_version()) is None:
       abort(404)
-    else:
-      customer.delete()
+    table_versions.bump(Customer.__tablename__)
+    entity_cache.invalidate(Customer, id)
 
-    return jsonify({
+    return json_response({
       'success': True,
       'customer' : id,
       'status': 200
@@ -132,78 +234,273 @@ def create_app(test_config=None):
     phone = body.get('phone', None)
     cif = body.get('cif', None)
     email = body.get('email', None)
+    latitude = body.get('latitude', None)
+    longitude = body.get('longitude', None)
+
+    if (latitude is not None or longitude is not None) and not valid_coordinates(latitude, longitude):
+      abort(422)
 
     try:
       if id is None:
-        business = Business(name=name, address=address, phone=phone, cif=cif, email=email)
+        business = Business(name=name, address=address, phone=phone, cif=cif, email=email,
+                            latitude=latitude, longitude=longitude)
       else:
-        business = Business(id=id, name=name, address=address, phone=phone, cif=cif, email=email)
+        business = Business(id=id, name=name, address=address, phone=phone, cif=cif, email=email,
+                            latitude=latitude, longitude=longitude)
       business.insert()
+      table_versions.bump(Business.__tablename__)
+      # drops a cached 404 for the new id
+      entity_cache.invalidate(Business, business.id)
     except:
       abort(422)
         
-    return jsonify({
+    return json_response({
       'success': True,
       'business' : business.long(),
       'status': 200
     }), 200
 
 
+  @app.route('/businesses/bulk', methods=['POST'])
+  @requires_auth('post:business')
+  def post_businesses_bulk(payload):
+    rows = request.get_json()
+    if not isinstance(rows, list) or len(rows) > BULK_MAX_ROWS:
+      abort(400)
+
+    results = bulk_insert(Business, rows)
+    created = [result['id'] for result in results if result['success']]
+    if created:
+      table_versions.bump(Business.__tablename__)
+      for id in created:
+        entity_cache.invalidate(Business, id)
+
+    return json_response({
+      'success': True,
+      'results': results,
+      'created': len(created),
+      'failed': len(results) - len(created),
+      'status': 200
+    }), 200
+
+
   @app.route('/businesses', methods=['PATCH'])
   @requires_auth('post:business')
   def patch_business(payload):
     body = request.get_json()
     id = body.get('id', None)
+    latitude = body.get('latitude', None)
+    longitude = body.get('longitude', None)
+
+    # a business moves with both coordinates at once
+    if (latitude is not None or longitude is not None) and not valid_coordinates(latitude, longitude):
+      abort(422)
+    if id is None:
+      abort(422)
+
+    # only the fields sent are written: one UPDATE, no read-modify-write to lose concurrent changes
+    values = dict((name, body[name]) for name in ('name', 'address', 'phone', 'cif', 'email')
+                  if body.get(name) is not None)
+    if latitude is not None:
+      values.update(latitude=latitude, longitude=longitude, geohash=business_geohash(latitude, longitude))
+
+    try:
+      business = update_returning(Business, id, values, if_match_version(), Business.LONG_FIELDS)
+    except SQLAlchemyError:
+      db.session.rollback()
+      abort(422)
+    if business is None:
+      abort(422)
+    table_versions.bump(Business.__tablename__)
+    entity_cache.invalidate(Business, id)
+
+    return json_response({
+      'success': True,
+      'business' : business,
+      'status': 200
+    }), 200, {'ETag': etag(business['version'])}
+
+
+  @app.route('/businesses/<int:id>', methods=['DELETE'])
+  @requires_auth('delete:business')
+  def delete_business(payolad, id):
+    # one DELETE for the products and one for the business, conditional on If-Match
+    children = delete_returning(Business, id, if_match_version(), cascade=(Product.business_id,))
+    if children is None:
+      abort(404)
+    table_versions.bump(Business.__tablename__)
+    # the products of the business are deleted with it
+    table_versions.bump(Product.__tablename__)
+    entity_cache.invalidate(Business, id)
+    for product_id in children[Product.business_id]:
+      entity_cache.invalidate(Product, product_id)
+
+    return json_response({
+      'success': True,
+      'business' : id,
+      'status': 200
+    }), 200
+
+
+  @app.route('/businesses/search')
+  @requires_auth('get:businesses')
+  def search_businesses_by_text(payload):
+    serializer = serializer_for(Business, 'short')
+    q, limit = search_args()
+
+    def build_results():
+      return {
+        'success': True,
+        'businesses' : serializer.to_dicts(search_businesses(q, serializer.fields, limit)),
+        'status': 200
+      }
+
+    return cached_listing(Business.__tablename__, ('search', q.lower(), limit), build_results)
+
+
+  @app.route('/businesses/near')
+  @requires_auth('get:businesses')
+  def get_businesses_near(payload):
+    serializer = serializer_for(Business, 'short')
+    latitude, longitude, radius, limit = near_args()
+
+    # not cached: points rarely repeat and would only push listing pages out of the cache
+    businesses = []
+    for distance, row in near_businesses(latitude, longitude, radius, serializer.fields, limit):
+      business = serializer.to_dict(row)
+      business['distance_km'] = round(distance, 3)
+      businesses.append(business)
+
+    return json_response({
+      'success': True,
+      'businesses' : businesses,
+      'status': 200
+    }), 200
+
+
+  @app.route('/businesses/<int:id>/products')
+  @requires_auth('get:businesses')
+  def get_business_products(payload, id):
+    serializer = serializer_for(Product, 'short')
+    limit, after = page_args()
+
+    def build_page():
+      if not db.session.query(Business.query.filter(Business.id == id).exists()).scalar():
+          abort(404)
+
+      query = projected_query(Product, serializer.fields).filter(Product.business_id == id)
+      products, next_cursor = paginate(query, Product.id, limit, after)
+
+      return {
+        'success': True,
+        'products' : serializer.to_dicts(products),
+        'next': next_cursor,
+        'status': 200
+      }
+
+    return cached_listing(Product.__tablename__, (id, limit, after), build_page)
+
+
+  @app.route('/products/<int:id>')
+  @requires_auth('get:businesses')
+  def get_product_by_id(payload, id):
+    serializer = serializer_for(Product, 'long')
+
+    def load_product():
+      product = projected_query(Product, serializer.fields).filter(Product.id == id).one_or_none()
+      if product is None:
+        return None
+      return {
+        'success': True,
+        'product' : serializer.to_dict(product),
+        'status': 200
+      }
+
+    body = entity_cache.get_or_load(Product, id, load_product)
+    if body is None:
+        abort(404)
+
+    return Response(body, mimetype='application/json'), 200
+
+
+  @app.route('/products', methods=['POST'])
+  @requires_auth('post:business')
+  def post_product(payload):
+    body = request.get_json()
     name = body.get('name', None)
-    address = body.get('address', None)
-    phone = body.get('phone', None)
-    cif = body.get('cif', None)
-    email = body.get('email', None)
+    price = body.get('price', None)
+    available = body.get('available', False)
+    business_id = body.get('business_id', None)
+
+    if business_id is None or Business.query.get(business_id) is None:
+      abort(422)
 
     try:
-      business = Business.query.filter(Business.id == id).one_or_none()
-      if name is not None:
-        business.name = name
-      if address is not None:
-        business.address = address
-      if phone is not None:
-        business.phone = phone
-      if cif is not None:
-        business.cif = cif
-      if email is not None:
-        business.email = email
-      business.insert()
+      product = Product(name=name, price=price, available=available, business_id=business_id)
+      product.insert()
+      table_versions.bump(Product.__tablename__)
+      # drops a cached 404 for the new id
+      entity_cache.invalidate(Product, product.id)
     except:
       abort(422)
-        
-    return jsonify({
+
+    return json_response({
       'success': True,
-      'business' : business.long(),
+      'product' : product.long(),
       'status': 200
     }), 200
 
 
+  @app.route('/products/<int:id>', methods=['PATCH'])
+  @requires_auth('post:business')
+  def patch_product(payload, id):
+    body = request.get_json()
+    product = Product.query.filter(Product.id == id).one_or_none()
+    if product is None:
+      abort(404)
 
-  @app.route('/businesses/<int:id>', methods=['DELETE'])
+    try:
+      if body.get('name') is not None:
+        product.name = body['name']
+      if body.get('price') is not None:
+        product.price = body['price']
+      if body.get('available') is not None:
+        product.available = body['available']
+      product.update()
+      table_versions.bump(Product.__tablename__)
+      entity_cache.invalidate(Product, id)
+    except:
+      abort(422)
+
+    return json_response({
+      'success': True,
+      'product' : product.long(),
+      'status': 200
+    }), 200
+
+
+  @app.route('/products/<int:id>', methods=['DELETE'])
   @requires_auth('delete:business')
-  def delete_business(payolad, id):
-    business = Business.query.filter(Business.id == id).one_or_none()
+  def delete_product(payload, id):
+    product = Product.query.filter(Product.id == id).one_or_none()
 
-    if business is None:
+    if product is None:
       abort(404)
     else:
-      business.delete()
+      product.delete()
+      table_versions.bump(Product.__tablename__)
+      entity_cache.invalidate(Product, id)
 
-    return jsonify({
+    return json_response({
       'success': True,
-      'business' : id,
+      'product' : id,
       'status': 200
     }), 200
 
 
   @app.errorhandler(404)
   def not_found(error):
-    return jsonify({
+    return json_response({
         'success': False,
         'error': 404,
         'message': "Resource Not Found"
@@ -212,7 +509,7 @@ def create_app(test_config=None):
 
   @app.errorhandler(400)
   def bad_request(error):
-      return jsonify({
+      return json_response({
           'success': False,
           'error': 400,
           'message': "Bad Request"
@@ -221,7 +518,7 @@ def create_app(test_config=None):
 
   @app.errorhandler(422)
   def unprocessable_entity(error):
-      return jsonify({
+      return json_response({
         'success': False,
         'error': 422,
         'message': "Unprocessable Entity"
@@ -230,16 +527,25 @@ def create_app(test_config=None):
 
   @app.errorhandler(405)
   def not_allowed(error):
-      return jsonify({
+      return json_response({
         'success': False,
         'error': 405,
         'message': "Method Not Allowed"
       }), 405
 
+
+  @app.errorhandler(412)
+  def precondition_failed(error):
+      return json_response({
+        'success': False,
+        'error': 412,
+        'message': "Precondition Failed"
+      }), 412
+
   
   @app.errorhandler(AuthError)
   def auth_error(error):
-    return jsonify({
+    return json_response({
         'success': False,
         'error': error.status_code,
         'message': error.error['description']
@@ -1,14 +1,41 @@
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
-from jose import jwt
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+from jose.utils import base64url_decode, long_to_base64
 from urllib.request import urlopen
+import rsa
+
+from metrics import timed_phase, jwks_fetch_duration
 
 AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.environ.get('API_AUDIENCE')
 
+# seconds a JWKS document is kept when Auth0 sends no Cache-Control max-age
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 600))
+# minimum seconds between two fetches of the JWKS document
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+# refresh an expired JWKS document in the background while the old keys keep serving requests
+JWKS_BACKGROUND_REFRESH = os.environ.get('JWKS_BACKGROUND_REFRESH', 'true').lower() in ('1', 'true', 'yes')
+# number of verified tokens kept in memory
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+# optional upper bound in seconds for trusting a verified token, its exp claim otherwise
+TOKEN_CACHE_MAX_TTL = os.environ.get('TOKEN_CACHE_MAX_TTL')
+TOKEN_CACHE_MAX_TTL = int(TOKEN_CACHE_MAX_TTL) if TOKEN_CACHE_MAX_TTL else None
+# where the signing keys come from: auth0 (default), file (JWKS_FILE) or local (in-process keypair)
+AUTH_KEY_PROVIDER = os.environ.get('AUTH_KEY_PROVIDER', 'auth0')
+JWKS_FILE = os.environ.get('JWKS_FILE')
+# expected iss claim for the file and local providers
+AUTH_ISSUER = os.environ.get('AUTH_ISSUER')
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -20,6 +47,383 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## Key Providers
+
+'''
+KeyProvider
+    a source of the JSON Web Key Set used to verify the tokens
+    fetch() returns the (jwks, max_age) pair, max_age is None when the source gives no hint
+    issuer is the iss claim expected in the tokens signed with those keys
+'''
+class KeyProvider:
+    issuer = None
+
+    def fetch(self):
+        raise NotImplementedError
+
+
+'''
+Auth0KeyProvider
+    fetches the key set from https://{domain}/.well-known/jwks.json
+'''
+class Auth0KeyProvider(KeyProvider):
+    def __init__(self, domain=AUTH0_DOMAIN):
+        self.url = f'https://{domain}/.well-known/jwks.json'
+        self.issuer = f'https://{domain}/'
+
+    def fetch(self):
+        response = urlopen(self.url)
+        jwks = json.loads(response.read())
+        return jwks, _parse_max_age(response.headers.get('Cache-Control'))
+
+
+'''
+JWKSFileProvider
+    reads the key set from a local JSON file, it is read again on every refresh
+'''
+class JWKSFileProvider(KeyProvider):
+    def __init__(self, path, issuer=None):
+        self.path = path
+        self.issuer = issuer or AUTH_ISSUER or f'https://{AUTH0_DOMAIN}/'
+
+    def fetch(self):
+        with open(self.path) as jwks_file:
+            return json.load(jwks_file), None
+
+
+'''
+RSAKeypairProvider
+    generates an RSA keypair in process and serves its public half as the key set
+    it can mint tokens with the chosen permissions, so the authenticated routes
+    can be tested and benchmarked without any network access
+    EXAMPLE
+        provider = RSAKeypairProvider()
+        configure_key_provider(provider)
+        token = provider.mint_token(['get:businesses'])
+'''
+class RSAKeypairProvider(KeyProvider):
+    def __init__(self, issuer=None, audience=None, kid='local', key_size=2048):
+        self.issuer = issuer or AUTH_ISSUER or 'https://i-buy-local.local/'
+        self.audience = audience or API_AUDIENCE
+        self.kid = kid
+        self._n, self._e, self._private_pem = _generate_rsa_keypair(key_size)
+
+    def public_jwk(self):
+        return {
+            'kty': 'RSA',
+            'kid': self.kid,
+            'use': 'sig',
+            'alg': ALGORITHMS[0],
+            'n': long_to_base64(self._n).decode('ascii'),
+            'e': long_to_base64(self._e).decode('ascii')
+        }
+
+    def fetch(self):
+        return {'keys': [self.public_jwk()]}, None
+
+    '''
+    mint_token(permissions)
+        returns a signed token carrying the permissions, valid for expires_in seconds
+        extra claims are added to (or override) the payload
+    '''
+    def mint_token(self, permissions, expires_in=3600, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': self.issuer,
+            'sub': 'local|benchmark',
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions)
+        }
+        if self.audience:
+            payload['aud'] = self.audience
+        payload.update(claims)
+        return jwt.encode(payload, self._private_pem, algorithm=ALGORITHMS[0],
+                          headers={'kid': self.kid})
+
+
+def _generate_rsa_keypair(key_size):
+    # cryptography is much faster at generating keys, python-rsa always ships with python-jose
+    try:
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa as crypto_rsa
+    except ImportError:
+        public_key, private_key = rsa.newkeys(key_size)
+        return public_key.n, public_key.e, private_key.save_pkcs1().decode('ascii')
+
+    private_key = crypto_rsa.generate_private_key(65537, key_size, default_backend())
+    numbers = private_key.public_key().public_numbers()
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption())
+    return numbers.n, numbers.e, private_pem.decode('ascii')
+
+
+def _key_provider_from_env():
+    if AUTH_KEY_PROVIDER == 'file':
+        # fail at startup: a missing file would otherwise look like a bad token on every request
+        if not JWKS_FILE:
+            raise RuntimeError('AUTH_KEY_PROVIDER=file needs JWKS_FILE, the path of the JWKS document')
+        return JWKSFileProvider(JWKS_FILE)
+    if AUTH_KEY_PROVIDER == 'local':
+        return RSAKeypairProvider()
+    return Auth0KeyProvider()
+
+
+## JWKS Cache
+
+'''
+JWKSCache
+    process-wide, thread-safe cache of the JSON Web Key Set served by a KeyProvider
+    the document is kept for the max-age sent in the Cache-Control header
+    (or JWKS_CACHE_TTL when there is none) and refreshed once on an unknown kid,
+    never more often than every min_refresh_interval seconds
+    stats counts cache hits, misses and refreshes (actual fetches)
+    version is bumped every time a fetch returns a different key set, the public
+    key objects are constructed once per version and looked up by kid
+    with background_refresh an expired copy keeps being served while a background
+    thread (a greenlet under gevent) fetches the new one, requests only wait on the
+    network for the very first fetch and for unknown kids
+'''
+class JWKSCache:
+    def __init__(self, provider, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                 background_refresh=JWKS_BACKGROUND_REFRESH):
+        self.provider = provider
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.background_refresh = background_refresh
+        self.version = 0
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0}
+        self._jwks = None
+        self._keys = {}
+        self._expires_at = 0
+        self._last_refresh = None
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._jwks is not None and time.monotonic() < self._expires_at:
+                self.stats['hits'] += 1
+                return self._jwks
+            self.stats['misses'] += 1
+            # a stale copy is still served while refreshes are throttled
+            if self._jwks is None:
+                self._refresh()
+            elif self._may_refresh():
+                if self.background_refresh:
+                    self._start_background_refresh()
+                else:
+                    self._refresh()
+            return self._jwks
+
+    def current_version(self):
+        self.get()
+        return self.version
+
+    '''
+    get_key(kid)
+        returns the (algorithm, public key object) pair of the signing key kid
+        or None when the key set does not contain it
+    '''
+    def get_key(self, kid):
+        self.get()
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        # unknown kid: the keys may have been rotated, refresh once
+        with self._lock:
+            if self._may_refresh():
+                self._refresh()
+            return self._keys.get(kid)
+
+    def set_provider(self, provider):
+        with self._lock:
+            self.provider = provider
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._jwks = None
+            self._keys = {}
+            self._expires_at = 0
+            self._last_refresh = None
+
+    def _may_refresh(self):
+        return (self._last_refresh is None or
+                time.monotonic() - self._last_refresh >= self.min_refresh_interval)
+
+    '''
+    wait_for_refresh(timeout)
+        blocks until the background refresh in progress (if any) is done
+    '''
+    def wait_for_refresh(self, timeout=None):
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _start_background_refresh(self):
+        # called with the lock held, _last_refresh throttles the next start
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._last_refresh = time.monotonic()
+        self._refresh_thread = threading.Thread(target=self._background_refresh, args=(self.provider,),
+                                                name='jwks-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def _background_refresh(self, provider):
+        # the fetch runs without the lock, requests keep reading the old keys meanwhile
+        try:
+            jwks, max_age = _timed_fetch(provider)
+        except Exception:
+            return
+        with self._lock:
+            # set_provider() or clear() while fetching: the result is not wanted anymore
+            if self.provider is provider and self._jwks is not None:
+                self._store(jwks, max_age, time.monotonic())
+
+    def _refresh(self):
+        self._last_refresh = time.monotonic()
+        try:
+            jwks, max_age = _timed_fetch(self.provider)
+        except Exception:
+            if self._jwks is None:
+                raise
+            # keep serving the old keys, the next refresh is throttled anyway
+            return
+        self._store(jwks, max_age, self._last_refresh)
+
+    def _store(self, jwks, max_age, fetched_at):
+        self.stats['refreshes'] += 1
+        if jwks != self._jwks:
+            self.version += 1
+            self._keys = _build_key_registry(jwks)
+        self._jwks = jwks
+        self._expires_at = fetched_at + (self.ttl if max_age is None else max_age)
+
+
+def _timed_fetch(provider):
+    start = time.perf_counter()
+    try:
+        result = provider.fetch()
+    except Exception:
+        jwks_fetch_duration.observe(('error',), time.perf_counter() - start)
+        raise
+    jwks_fetch_duration.observe(('ok',), time.perf_counter() - start)
+    return result
+
+
+def _build_key_registry(jwks):
+    registry = {}
+    for key in jwks['keys']:
+        algorithm = key.get('alg', ALGORITHMS[0])
+        if algorithm not in ALGORITHMS:
+            continue
+        try:
+            registry[key['kid']] = (algorithm, jwk.construct(key, algorithm))
+        except Exception:
+            # a key we cannot use is treated as an unknown kid
+            continue
+    return registry
+
+
+def _parse_max_age(cache_control):
+    if not cache_control:
+        return None
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+jwks_cache = JWKSCache(_key_provider_from_env())
+
+
+## Verified Token Cache
+
+'''
+TokenCache
+    bounded LRU of already verified jwt payloads keyed by the sha256 digest of the token
+    an entry expires at the exp claim of the token (or earlier when max_ttl is set)
+    and every entry is dropped when the JWKS key version changes
+    stats counts cache hits, misses and evictions
+'''
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, max_ttl=TOKEN_CACHE_MAX_TTL):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = OrderedDict()
+        self._key_version = None
+        self._lock = threading.Lock()
+
+    def get(self, token, key_version):
+        digest = _token_digest(token)
+        with self._lock:
+            self._check_key_version(key_version)
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[digest]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.stats['hits'] += 1
+            return payload
+
+    def put(self, token, payload, key_version):
+        expires_at = payload.get('exp')
+        if self.max_ttl is not None:
+            expires_at = min(expires_at or float('inf'), time.time() + self.max_ttl)
+        if expires_at is None or self.maxsize <= 0:
+            return
+        digest = _token_digest(token)
+        with self._lock:
+            self._check_key_version(key_version)
+            if key_version != self._key_version:
+                return
+            self._entries[digest] = (payload, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _check_key_version(self, key_version):
+        # the signing keys rotated, nothing verified with the old ones is trusted
+        if self._key_version is None or key_version > self._key_version:
+            self._entries.clear()
+            self._key_version = key_version
+
+
+def _token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+token_cache = TokenCache()
+
+
+'''
+configure_key_provider(provider)
+    replaces the source of the signing keys and drops every cached key and token
+    EXAMPLE
+        configure_key_provider(JWKSFileProvider('jwks.json', issuer='https://issuer/'))
+'''
+def configure_key_provider(provider):
+    jwks_cache.set_provider(provider)
+    token_cache.clear()
+
+
 ## Auth Header
 
 '''
@@ -93,43 +497,44 @@ def check_permissions(permission, payload):
         token: a json web token (string)
 
     it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
+    it should verify the token using Auth0 /.well-known/jwks.json (served from jwks_cache,
+    see configure_key_provider to use a local key set instead)
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
 
+    tokens that were already verified with the current keys are served from token_cache
+
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
     try:
-        jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-        jwks = json.loads(jsonurl.read())
+        key_version = jwks_cache.current_version()
+        payload = token_cache.get(token, key_version)
+        if payload is not None:
+            return payload
+
         unverified_header = jwt.get_unverified_header(token)
-        rsa_key = {}
         if 'kid' not in unverified_header:
             raise AuthError({
                 'code': 'invalid_header',
                 'description': 'Authorization malformed.'
             }, 401)
 
-        for key in jwks['keys']:
-            if key['kid'] == unverified_header['kid']:
-                rsa_key = {
-                    'kty': key['kty'],
-                    'kid': key['kid'],
-                    'use': key['use'],
-                    'n': key['n'],
-                    'e': key['e']
-                }
-        if rsa_key:
+        key = jwks_cache.get_key(unverified_header['kid'])
+        if key is not None:
             try:
+                _verify_signature(token, unverified_header, key)
+                # the signature was checked with the prepared key, only the claims are left
                 payload = jwt.decode(
                     token,
-                    rsa_key,
+                    '',
                     algorithms=ALGORITHMS,
                     audience=API_AUDIENCE,
-                    issuer='https://' + AUTH0_DOMAIN + '/'
+                    issuer=jwks_cache.provider.issuer,
+                    options={'verify_signature': False}
                 )
+                token_cache.put(token, payload, key_version)
                 return payload
 
             except jwt.ExpiredSignatureError:
@@ -154,6 +559,32 @@ def verify_decode_jwt(token):
             'description': 'Unable to find the appropriate key.'
         }, 400)
 
+'''
+_verify_signature(token, header, key)
+    checks the RS256 signature of the token with a prepared (algorithm, key) pair
+    it should raise a JWTError if the algorithm does not match or the signature is wrong
+'''
+def _verify_signature(token, header, key):
+    algorithm, public_key = key
+    if header.get('alg') != algorithm:
+        raise JWTError('The specified alg value is not allowed')
+
+    signing_input, _, signature = token.encode('utf-8').rpartition(b'.')
+    if not public_key.verify(signing_input, base64url_decode(signature)):
+        raise JWTError('Signature verification failed.')
+
+'''
+authorize(permission)
+    the decoded payload of the bearer token of the current request once its
+    signature, claims and permission are checked, the auth phase of the request metrics
+'''
+@timed_phase('auth')
+def authorize(permission=''):
+    token = get_token_auth_header()
+    payload = verify_decode_jwt(token)
+    check_permissions(permission, payload)
+    return payload
+
 '''
 @DONE implement @requires_auth(permission) decorator method
     @INPUTS
@@ -168,10 +599,7 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
-            
+            payload = authorize(permission)
             return f(payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -0,0 +1,161 @@
+'''
+bench_concurrency
+    concurrent-request throughput of gunicorn sync workers (app:app) against
+    gevent workers (gevent_app:app) with the same number of processes
+    every request waits --latency-ms in a gunicorn pre_request hook, standing in
+    for the time spent on PostgreSQL or Auth0 (time.sleep is cooperative under gevent)
+    tokens are signed by a local keypair whose JWKS the server reads from a file
+    RUN
+        python -m benchmarks.bench_concurrency [--workers 2] [--concurrency 8 64] [--latency-ms 50]
+                                               [--database URL] [--reset]
+'''
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from auth import RSAKeypairProvider
+from benchmarks.common import make_app, reset_database
+from benchmarks.bench_near import CENTER, seed_located
+
+HOOKS = '''
+import os
+import time
+
+LATENCY = float(os.environ['BENCH_LATENCY_MS']) / 1000
+
+
+def pre_request(worker, req):
+    time.sleep(LATENCY)
+'''
+
+PATH = '/businesses/near?lat={}&lon={}&radius=5&limit=20'.format(*CENTER)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(mode, workers, worker_connections, port, env, hooks_path):
+    # the gunicorn script of the interpreter running the benchmark
+    command = [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()', '-c', hooks_path, '-w', str(workers),
+               '-b', '127.0.0.1:{}'.format(port), '--log-level', 'warning']
+    if mode == 'gevent':
+        command += ['-k', 'gevent', '--worker-connections', str(worker_connections), 'gevent_app:app']
+    else:
+        command += ['app:app']
+    server = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('the {} server did not start'.format(mode))
+
+
+def load(port, token, concurrency, duration):
+    latencies = []
+    errors = []
+    stop_at = time.monotonic() + duration
+    headers = {'Authorization': 'Bearer {}'.format(token)}
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', PATH, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+            except (OSError, http.client.HTTPException) as error:
+                errors.append(type(error).__name__)
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None
+    }
+
+
+def run(workers, concurrencies, latency_ms, duration, database_path=None, rows=10000, key_size=1024, reset=False):
+    app = make_app(database_path)
+    with app.app_context():
+        reset_database(reset)
+        seed_located(rows, random.Random(42))
+    database_path = app.config['SQLALCHEMY_DATABASE_URI']
+
+    provider = RSAKeypairProvider(audience='i-buy-local-bench', key_size=key_size)
+    token = provider.mint_token(['get:businesses'])
+    workdir = tempfile.mkdtemp(prefix='bench_concurrency_')
+    jwks_path = os.path.join(workdir, 'jwks.json')
+    hooks_path = os.path.join(workdir, 'hooks.py')
+    with open(jwks_path, 'w') as jwks_file:
+        json.dump(provider.fetch()[0], jwks_file)
+    with open(hooks_path, 'w') as hooks_file:
+        hooks_file.write(HOOKS)
+    env = dict(os.environ, DATABASE_URL=database_path, DB_SCHEMA_MODE='migrations',
+               AUTH_KEY_PROVIDER='file', JWKS_FILE=jwks_path, AUTH_ISSUER=provider.issuer,
+               API_AUDIENCE=provider.audience, BENCH_LATENCY_MS=str(latency_ms))
+
+    results = []
+    for mode in ('sync', 'gevent'):
+        port = free_port()
+        server = start_server(mode, workers, max(concurrencies), port, env, hooks_path)
+        try:
+            for concurrency in concurrencies:
+                result = load(port, token, concurrency, duration)
+                result.update({'mode': mode, 'concurrency': concurrency})
+                results.append(result)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 64])
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--reset', action='store_true')
+    args = parser.parse_args()
+
+    for result in run(args.workers, args.concurrency, args.latency_ms, args.duration, args.database,
+                      reset=args.reset):
+        print('{:>6} x{:<4} {:>8.1f} req/s  p50 {:>8.1f} ms  p99 {:>8.1f} ms  {} errors'.format(
+            result['mode'], result['concurrency'], result['requests_per_second'],
+            result['p50_ms'] or 0, result['p99_ms'] or 0, result['errors']))
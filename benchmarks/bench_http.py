@@ -0,0 +1,340 @@
+'''
+bench_http
+    throughput, p50 / p95 / p99 latency and allocations of the routes of app.py
+    (list, detail, post, patch and delete of businesses and customers) at several
+    dataset sizes and concurrency levels
+    create_app() is driven in-process through its WSGI interface by --concurrency
+    client threads (like the threads of a gthread worker), the HTTP server is left
+    out (see bench_concurrency), tokens are signed by a local keypair
+    the list and detail requests walk random pages and ids, so the caches see
+    the same mix of hits and misses on every run (the generator is seeded);
+    every post creates a row, the deletes remove them again
+    allocations: peak and retained bytes traced by tracemalloc per request,
+    measured on --alloc-requests sequential requests before the timed ones
+    --profile benchmarks one dataset of seeding.SEED_PROFILES (manage.py seed) instead of --sizes
+    results are written to --output as JSON, --baseline compares them with a previous
+    file and exits with 1 when a route lost more than --threshold of its throughput
+    or p95 latency
+    RUN
+        python -m benchmarks.bench_http [--sizes 1000 10000 | --profile small] [--concurrency 1 8] [--requests 500]
+                                        [--database URL] [--reset] [--output results.json]
+                                        [--baseline previous.json] [--threshold 0.15]
+'''
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+
+from auth import RSAKeypairProvider, configure_key_provider
+from cache import listing_cache, entity_cache, LRUCacheBackend
+from models import db, Business, Customer
+from pagination import encode_cursor
+from seeding import SEED_PROFILES, seed_database
+from benchmarks.common import reset_database, business_row, customer_row
+
+PERMISSIONS = ['get:businesses', 'get:business-detail', 'post:business', 'delete:business',
+               'get:customers', 'get:customer-detail', 'post:customer', 'delete:customer']
+# there is no PATCH route for the customers
+ROUTES = (
+    ('businesses', 'list'), ('businesses', 'detail'), ('businesses', 'post'),
+    ('businesses', 'patch'), ('businesses', 'delete'),
+    ('customers', 'list'), ('customers', 'detail'), ('customers', 'post'), ('customers', 'delete')
+)
+PAGE_SIZE = 50
+
+
+## Database
+
+'''
+make_bench_app(database_path)
+    the application of app.py bound to database_path (a temporary SQLite file by default)
+    app.py reads DATABASE_URL when it is imported, so it is imported here
+'''
+def make_bench_app(database_path=None):
+    if database_path is None:
+        handle, filename = tempfile.mkstemp(suffix='.db', prefix='bench_http_')
+        os.close(handle)
+        atexit.register(os.remove, filename)
+        database_path = 'sqlite:///' + filename
+    os.environ['DATABASE_URL'] = database_path
+    os.environ['DB_SCHEMA_MODE'] = 'create_all'
+    from app import create_app
+    return create_app()
+
+
+'''
+grow(model, start, stop)
+    inserts the rows start..stop-1 of the benchmark dataset, the sizes are reached one after the other
+'''
+def grow(model, start, stop, batch_size=5000):
+    make_row = business_row if model is Business else customer_row
+    for first in range(start, stop, batch_size):
+        rows = [make_row(i) for i in range(first, min(first + batch_size, stop))]
+        db.session.execute(model.__table__.insert(), rows)
+    db.session.commit()
+
+
+def clear_caches():
+    listing_cache.clear()
+    entity_cache.backend = LRUCacheBackend(entity_cache.backend.maxsize)
+
+
+## Requests
+
+'''
+RequestMaker
+    builds the (method, path, json body) of every request of a route
+    posted ids are kept so the deletes remove the rows created by the posts
+'''
+class RequestMaker:
+    def __init__(self, ids, rng):
+        self.ids = ids
+        self.rng = rng
+        self.posted = dict((resource, deque()) for resource in ('businesses', 'customers'))
+        self.serial = 0
+
+    def make(self, resource, action):
+        ids = self.ids[resource]
+        if action == 'list':
+            after = self.rng.choice(ids)
+            return 'GET', '/{}?limit={}&after={}'.format(resource, PAGE_SIZE, encode_cursor(after)), None
+        if action == 'detail':
+            return 'GET', '/{}/{}'.format(resource, self.rng.choice(ids)), None
+        if action == 'patch':
+            return 'PATCH', '/' + resource, {'id': self.rng.choice(ids),
+                                             'address': 'Patched street {}'.format(self.rng.randrange(10 ** 6))}
+        if action == 'post':
+            self.serial += 1
+            row = (business_row if resource == 'businesses' else customer_row)('post{}'.format(self.serial))
+            return 'POST', '/' + resource, row
+        # delete: the oldest row posted and not deleted yet
+        return 'DELETE', '/{}/{}'.format(resource, self.posted[resource].popleft()), None
+
+
+def send(client, headers, request):
+    method, path, body = request
+    response = client.open(path, method=method, headers=headers, json=body, buffered=True)
+    response.get_data()
+    return response
+
+
+def percentile(ordered, fraction):
+    # nearest rank
+    if not ordered:
+        return None
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+
+'''
+measure_allocations(app, headers, requests)
+    mean peak and retained bytes traced by tracemalloc per request, run sequentially
+'''
+def measure_allocations(app, headers, requests, on_response):
+    client = app.test_client()
+    peaks = []
+    retained = []
+    tracemalloc.start()
+    try:
+        for request in requests:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            response = send(client, headers, request)
+            current, peak = tracemalloc.get_traced_memory()
+            on_response(request, response)
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return statistics.mean(peaks) if peaks else None, statistics.mean(retained) if retained else None
+
+
+'''
+load(app, headers, requests, concurrency)
+    sends the requests from concurrency threads, each one with its own client
+    return the latencies in seconds, the statuses of the failed requests and the elapsed time
+'''
+def load(app, headers, requests, concurrency, on_response):
+    pending = deque(requests)
+    latencies = []
+    errors = []
+
+    def client_thread():
+        client = app.test_client()
+        while True:
+            try:
+                request = pending.popleft()
+            except IndexError:
+                return
+            start = time.perf_counter()
+            response = send(client, headers, request)
+            elapsed = time.perf_counter() - start
+            on_response(request, response)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+            else:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client_thread) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def run(sizes, concurrencies, requests, alloc_requests=20, database_path=None, seed=42, key_size=1024,
+        profile=None, reset=False):
+    provider = RSAKeypairProvider(key_size=key_size)
+    configure_key_provider(provider)
+    headers = {'Authorization': 'Bearer {}'.format(provider.mint_token(PERMISSIONS))}
+    app = make_bench_app(database_path)
+    rng = random.Random(seed)
+
+    results = []
+    with app.app_context():
+        reset_database(reset)
+        dialect = db.engine.dialect.name
+        current = 0
+        for size in [profile] if profile else sorted(sizes):
+            if profile:
+                seed_database(SEED_PROFILES[profile], seed)
+            else:
+                grow(Business, current, size)
+                grow(Customer, current, size)
+                current = size
+            ids = {'businesses': [id for id, in db.session.query(Business.id)],
+                   'customers': [id for id, in db.session.query(Customer.id)]}
+            db.session.remove()
+            maker = RequestMaker(ids, rng)
+
+            def on_response(request, response):
+                method, path, _ = request
+                if method == 'POST' and response.status_code == 200:
+                    resource = path.strip('/')
+                    maker.posted[resource].append(response.get_json()['business']['id'])
+
+            for concurrency in concurrencies:
+                clear_caches()
+                for resource, action in ROUTES:
+                    batch = [maker.make(resource, action) for _ in range(alloc_requests + requests)]
+                    # the allocation pass warms the caches and the connections up
+                    alloc_peak, alloc_retained = measure_allocations(app, headers, batch[:alloc_requests],
+                                                                     on_response)
+                    latencies, errors, elapsed = load(app, headers, batch[alloc_requests:], concurrency,
+                                                      on_response)
+                    latencies.sort()
+                    results.append({
+                        'route': '{}.{}'.format(resource, action),
+                        'method': batch[0][0],
+                        'size': size,
+                        'concurrency': concurrency,
+                        'requests': len(latencies),
+                        'errors': len(errors),
+                        'requests_per_second': len(latencies) / elapsed if elapsed else None,
+                        'p50_ms': _ms(percentile(latencies, 0.50)),
+                        'p95_ms': _ms(percentile(latencies, 0.95)),
+                        'p99_ms': _ms(percentile(latencies, 0.99)),
+                        'alloc_peak_bytes': alloc_peak,
+                        'alloc_retained_bytes': alloc_retained
+                    })
+
+    return {'meta': _meta(dialect, [profile] if profile else sorted(sizes), concurrencies, requests, seed),
+            'results': results}
+
+
+def _ms(seconds):
+    return seconds * 1000 if seconds is not None else None
+
+
+def _meta(dialect, sizes, concurrencies, requests, seed):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': dialect,
+        'sizes': sizes,
+        'concurrency': concurrencies,
+        'requests': requests,
+        'seed': seed
+    }
+
+
+## Comparison
+
+'''
+compare(baseline, current, threshold)
+    the regressions of current against baseline: routes (same size and concurrency)
+    whose throughput dropped or whose p95 latency grew by more than threshold (0.15 = 15%)
+'''
+def compare(baseline, current, threshold):
+    previous = dict(((result['route'], result['size'], result['concurrency']), result)
+                    for result in baseline['results'])
+    regressions = []
+    for result in current['results']:
+        before = previous.get((result['route'], result['size'], result['concurrency']))
+        if before is None:
+            continue
+        if before['requests_per_second'] and result['requests_per_second'] is not None and \
+                result['requests_per_second'] < before['requests_per_second'] * (1 - threshold):
+            regressions.append((result, 'requests_per_second', before['requests_per_second'],
+                                result['requests_per_second']))
+        if before['p95_ms'] and result['p95_ms'] is not None and \
+                result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append((result, 'p95_ms', before['p95_ms'], result['p95_ms']))
+        if result['errors'] > before['errors']:
+            regressions.append((result, 'errors', before['errors'], result['errors']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--profile', default=None, choices=sorted(SEED_PROFILES))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--alloc-requests', type=int, default=20)
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--reset', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.15)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.concurrency, args.requests, args.alloc_requests, args.database, args.seed,
+                 profile=args.profile, reset=args.reset)
+    for result in report['results']:
+        print('{:<20} {:>7} x{:<3} {:>8.1f} req/s  p50 {:>7.2f}  p95 {:>7.2f}  p99 {:>7.2f} ms  '
+              '{:>7.1f} KiB peak  {} errors'.format(
+                  result['route'], result['size'], result['concurrency'], result['requests_per_second'] or 0,
+                  result['p50_ms'] or 0, result['p95_ms'] or 0, result['p99_ms'] or 0,
+                  (result['alloc_peak_bytes'] or 0) / 1024, result['errors']))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(json.load(baseline_file), report, args.threshold)
+        for result, metric, before, after in regressions:
+            print('REGRESSION {} {} rows x{} {}: {:.2f} -> {:.2f}'.format(
+                result['route'], result['size'], result['concurrency'], metric, before, after))
+        sys.exit(1 if regressions else 0)
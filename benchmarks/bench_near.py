@@ -0,0 +1,89 @@
+'''
+bench_near
+    latency of k-nearest queries of GET /businesses/near: the geohash candidate scan
+    of search.near_businesses against computing the distance to every business
+    businesses are spread over a 200 x 200 km square, denser towards its centre
+    RUN
+        python -m benchmarks.bench_near [--rows 300000] [--radius 2 10] [--database URL] [--reset]
+'''
+import argparse
+import heapq
+import random
+import statistics
+import time
+
+from models import db, projected_query, business_geohash, Business
+from search import near_businesses
+from serializers import serializer_for
+from geo import KM_PER_DEGREE, haversine_km
+from benchmarks.common import make_app, reset_database, business_row
+
+CENTER = (40.4168, -3.7038)
+HALF_SIDE_KM = 100
+
+
+def random_point(rng):
+    # two thirds of the businesses within 20 km of the centre, the rest anywhere
+    spread = 20 if rng.random() < 2 / 3 else HALF_SIDE_KM
+    dy = max(-HALF_SIDE_KM, min(HALF_SIDE_KM, rng.gauss(0, spread / 2)))
+    dx = max(-HALF_SIDE_KM, min(HALF_SIDE_KM, rng.gauss(0, spread / 2)))
+    return CENTER[0] + dy / KM_PER_DEGREE, CENTER[1] + dx / (KM_PER_DEGREE * 0.76)
+
+
+def seed_located(count, rng, batch_size=5000):
+    table = Business.__table__
+    for start in range(0, count, batch_size):
+        rows = []
+        for i in range(start, min(start + batch_size, count)):
+            row = business_row(i)
+            row['latitude'], row['longitude'] = random_point(rng)
+            row['geohash'] = business_geohash(row['latitude'], row['longitude'])
+            rows.append(row)
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def full_scan(latitude, longitude, radius, fields, limit):
+    width = len(fields)
+    query = projected_query(Business, tuple(fields) + ('latitude', 'longitude'))
+    candidates = ((haversine_km(latitude, longitude, row[width], row[width + 1]), row[:width]) for row in query)
+    return heapq.nsmallest(limit, (candidate for candidate in candidates if candidate[0] <= radius),
+                           key=lambda candidate: candidate[0])
+
+
+def run(rows, radii, database_path=None, queries=50, limit=20, reset=False):
+    fields = serializer_for(Business, 'short').fields
+    rng = random.Random(42)
+    results = []
+    app = make_app(database_path)
+    with app.app_context():
+        reset_database(reset)
+        seed_located(rows, rng)
+        points = [random_point(rng) for _ in range(queries)]
+        for radius in radii:
+            for name, near, repeat in (('full_scan', full_scan, 3), ('geohash', near_businesses, queries)):
+                timings = []
+                found = 0
+                for latitude, longitude in points[:repeat]:
+                    start = time.perf_counter()
+                    found += len(near(latitude, longitude, radius, fields, limit))
+                    timings.append((time.perf_counter() - start) * 1000)
+                    db.session.remove()
+                timings.sort()
+                results.append({'radius_km': radius, 'path': name, 'found': found / len(timings),
+                                'median_ms': statistics.median(timings), 'max_ms': timings[-1]})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--radius', type=float, nargs='+', default=[2, 10])
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--reset', action='store_true')
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    for result in run(args.rows, args.radius, args.database, args.queries, reset=args.reset):
+        print('{:>5} km {:>9} {:>5.1f} found  median {:>8.2f} ms  max {:>8.2f} ms'.format(
+            result['radius_km'], result['path'], result['found'], result['median_ms'], result['max_ms']))
@@ -0,0 +1,57 @@
+'''
+bench_projection
+    rows per second of the listing query: full ORM hydration + short()
+    against the projected SELECT + per-view serializer used by the routes
+    RUN
+        python -m benchmarks.bench_projection [--sizes 10000 100000] [--database URL] [--reset]
+'''
+import argparse
+
+from models import db, projected_query, Business
+from serializers import serializer_for
+from benchmarks.common import make_app, reset_database, seed, best_of
+
+
+def orm_listing():
+    return [business.short() for business in Business.query.order_by(Business.id).all()]
+
+
+def projected_listing():
+    serializer = serializer_for(Business, 'short')
+    rows = projected_query(Business, serializer.fields).order_by(Business.id).all()
+    return serializer.to_dicts(rows)
+
+
+def run(sizes, database_path=None, repeat=3, reset=False):
+    results = []
+    for index, size in enumerate(sizes):
+        app = make_app(database_path)
+        with app.app_context():
+            # after the first size the rows are the ones of the previous size
+            reset_database(reset or index > 0)
+            seed(Business, size)
+            for name, listing in (('orm', orm_listing), ('projected', projected_listing)):
+                # a fresh session per run, the identity map must not be reused
+                def timed_listing():
+                    listing()
+                    db.session.remove()
+                elapsed = best_of(timed_listing, repeat)
+                results.append({'rows': size, 'path': name, 'seconds': elapsed,
+                                'rows_per_second': size / elapsed})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--reset', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.database, args.repeat, args.reset)
+    for size in args.sizes:
+        by_path = {r['path']: r for r in results if r['rows'] == size}
+        print('{:>7} rows  orm {:>10.0f} rows/s  projected {:>10.0f} rows/s  x{:.2f}'.format(
+            size, by_path['orm']['rows_per_second'], by_path['projected']['rows_per_second'],
+            by_path['projected']['rows_per_second'] / by_path['orm']['rows_per_second']))
@@ -0,0 +1,64 @@
+'''
+bench_search
+    latency of GET /businesses/search queries: the indexed search of search.py
+    (FTS5 trigram on SQLite, pg_trgm on PostgreSQL) against a plain LIKE scan
+    RUN
+        python -m benchmarks.bench_search [--rows 100000] [--database URL] [--reset]
+'''
+import argparse
+import statistics
+import time
+from sqlalchemy import or_
+
+from models import projected_query, Business
+from search import search_businesses
+from serializers import serializer_for
+from benchmarks.common import make_app, reset_database, seed
+
+# a unique name, a unique address, a substring shared by a tenth of the rows, a miss
+QUERIES = ('ness4242', 'Street 77777', 'ness9', 'nowhere')
+
+
+def indexed_search(q, fields, limit):
+    return search_businesses(q, fields, limit)
+
+
+def like_scan(q, fields, limit):
+    pattern = '%' + q + '%'
+    return projected_query(Business, fields) \
+        .filter(or_(Business.name.ilike(pattern), Business.address.ilike(pattern))) \
+        .order_by(Business.id).limit(limit).all()
+
+
+def run(rows, database_path=None, repeat=50, limit=20, reset=False):
+    fields = serializer_for(Business, 'short').fields
+    results = []
+    app = make_app(database_path)
+    with app.app_context():
+        reset_database(reset)
+        seed(Business, rows)
+        for q in QUERIES:
+            for name, search in (('like', like_scan), ('indexed', indexed_search)):
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    found = search(q, fields, limit)
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                results.append({'query': q, 'path': name, 'found': len(found),
+                                'median_ms': statistics.median(timings),
+                                'p95_ms': timings[int(len(timings) * 0.95) - 1]})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--reset', action='store_true')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    for result in run(args.rows, args.database, args.repeat, reset=args.reset):
+        print('{:>14} {:>8} {:>3} found  median {:>7.2f} ms  p95 {:>7.2f} ms'.format(
+            repr(result['query']), result['path'], result['found'], result['median_ms'], result['p95_ms']))
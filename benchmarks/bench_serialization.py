@@ -0,0 +1,44 @@
+'''
+bench_serialization
+    time to encode a listing response with flask jsonify against serializers.json_response
+    RUN
+        python -m benchmarks.bench_serialization [--rows 10000]
+'''
+import argparse
+from flask import Flask, jsonify
+
+from models import Business
+from serializers import json_backend, json_response, serializer_for
+from benchmarks.common import best_of, business_row
+
+
+def run(rows, repeat=5):
+    serializer = serializer_for(Business, 'short')
+    tuples = [tuple(dict(business_row(i), id=i)[field] for field in serializer.fields)
+              for i in range(rows)]
+
+    app = Flask(__name__)
+    results = {}
+    with app.test_request_context():
+        results['jsonify'] = best_of(lambda: jsonify({
+            'success': True,
+            'businesses': serializer.to_dicts(tuples),
+            'status': 200
+        }), repeat)
+        results['json_response'] = best_of(lambda: json_response({
+            'success': True,
+            'businesses': serializer.to_dicts(tuples),
+            'status': 200
+        }), repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    results = run(args.rows)
+    print('backend: {}'.format(json_backend))
+    for name, seconds in results.items():
+        print('{:>14} {:>8.2f} ms  {:>10.0f} rows/s'.format(name, seconds * 1000, args.rows / seconds))
@@ -0,0 +1,75 @@
+'''
+bench_startup
+    boot time of the application with DB_SCHEMA_MODE=create_all against migrations
+    cold: a new interpreter importing app (what a gunicorn worker or a deploy pays)
+    warm: create_app() in a running process, create_all running on every call as it
+          did before setup_db remembered the databases it had created
+    RUN
+        python -m benchmarks.bench_startup [--repeat 10] [--database URL]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import make_app
+
+MODES = ('create_all', 'migrations')
+
+
+# run in a child interpreter, app.py reads DATABASE_URL and DB_SCHEMA_MODE on import
+WARM_SCRIPT = """
+import json, sys, time
+import models
+from app import create_app
+timings = []
+for _ in range(int(sys.argv[1])):
+    models._created_schemas.clear()
+    start = time.perf_counter()
+    create_app()
+    timings.append(time.perf_counter() - start)
+print(json.dumps(timings))
+"""
+
+
+def cold_start(env, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app'], env=env, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def warm_start(env, repeat):
+    output = subprocess.run([sys.executable, '-c', WARM_SCRIPT, str(repeat)], env=env, check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+
+def run(database_path=None, repeat=10):
+    # a database with the tables already there, like a deployed one
+    app = make_app(database_path)
+    database_path = app.config['SQLALCHEMY_DATABASE_URI']
+    results = []
+    for kind, measure in (('cold', cold_start), ('warm', warm_start)):
+        for mode in MODES:
+            env = dict(os.environ, DATABASE_URL=database_path, DB_SCHEMA_MODE=mode)
+            timings = measure(env, repeat)
+            results.append({'kind': kind, 'mode': mode, 'median_ms': statistics.median(timings) * 1000,
+                            'max_ms': max(timings) * 1000})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database', default=None)
+    args = parser.parse_args()
+
+    for result in run(args.database, args.repeat):
+        print('{:>4} {:>10}  median {:>8.1f} ms  max {:>8.1f} ms'.format(
+            result['kind'], result['mode'], result['median_ms'], result['max_ms']))
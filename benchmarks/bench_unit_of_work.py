@@ -0,0 +1,61 @@
+'''
+bench_unit_of_work
+    1000 mixed writes (60% insert, 30% update, 10% delete) through the model helpers,
+    one commit per helper call against a single commit with models.batch()
+    RUN
+        python -m benchmarks.bench_unit_of_work [--operations 1000] [--database URL] [--reset]
+'''
+import argparse
+import time
+from sqlalchemy import event
+
+from models import db, batch, Business
+from benchmarks.common import make_app, reset_database, seed, business_row
+
+
+def workload(operations, offset):
+    updates = operations * 3 // 10
+    deletes = operations // 10
+    inserts = operations - updates - deletes
+    for i in range(inserts):
+        Business(**business_row(offset + i)).insert()
+    for id in range(1, updates + 1):
+        business = Business.query.get(id)
+        business.address = 'Updated {}'.format(offset)
+        business.update()
+    for business in Business.query.order_by(Business.id.desc()).limit(deletes).all():
+        business.delete()
+
+
+def run(operations, database_path=None, reset=False):
+    app = make_app(database_path)
+    commits = []
+    event.listen(db.engine, 'commit', lambda connection: commits.append(1))
+
+    results = {}
+    with app.app_context():
+        reset_database(reset)
+        seed(Business, operations)
+        for offset, mode in ((operations, 'one_shot'), (operations * 2, 'batch')):
+            del commits[:]
+            start = time.perf_counter()
+            if mode == 'batch':
+                with batch():
+                    workload(operations, offset)
+            else:
+                workload(operations, offset)
+            results[mode] = {'seconds': time.perf_counter() - start, 'commits': len(commits)}
+            db.session.remove()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--reset', action='store_true')
+    args = parser.parse_args()
+
+    results = run(args.operations, args.database, args.reset)
+    for mode, result in results.items():
+        print('{:>9} {:>8.1f} ms  {:>5} commits'.format(mode, result['seconds'] * 1000, result['commits']))
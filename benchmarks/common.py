@@ -0,0 +1,92 @@
+import atexit
+import os
+import tempfile
+import time
+from flask import Flask
+from sqlalchemy import inspect, select
+
+from models import db, setup_db, Business
+
+
+'''
+make_app(database_path)
+    bare flask application bound to the database, without routes
+    a temporary SQLite file is used when no database_path is given
+'''
+def make_app(database_path=None):
+    if database_path is None:
+        handle, filename = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(handle)
+        atexit.register(os.remove, filename)
+        database_path = 'sqlite:///' + filename
+    app = Flask(__name__)
+    setup_db(app, database_path)
+    return app
+
+
+'''
+reset_database(reset)
+    drops and recreates the tables of the models, the benchmarks start from empty tables
+    refuses when one of them already holds rows unless reset is True (--reset):
+    a mistyped --database must not wipe a real database
+'''
+def reset_database(reset=False):
+    if not reset:
+        existing = set(inspect(db.engine).get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name in existing and db.session.execute(select([1]).select_from(table).limit(1)).first():
+                # repr hides the password of the URL
+                raise SystemExit('the {} table of {} holds rows, pass --reset to drop every table '
+                                 'of the database'.format(table.name, repr(db.engine.url)))
+    if db.engine.dialect.name == 'sqlite':
+        # the FTS5 shadow table is not part of the metadata, drop_all leaves it behind
+        db.session.execute('DROP TABLE IF EXISTS businesses_fts')
+        db.session.commit()
+    db.drop_all()
+    db.create_all()
+
+
+'''
+seed(model, rows, batch_size)
+    inserts rows generated by business_row / customer_row with executemany
+'''
+def seed(model, count, batch_size=5000):
+    make_row = business_row if model is Business else customer_row
+    table = model.__table__
+    for start in range(0, count, batch_size):
+        rows = [make_row(i) for i in range(start, min(start + batch_size, count))]
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def business_row(i):
+    return {
+        'name': 'business{}'.format(i),
+        'email': 'business{}@example.com'.format(i),
+        'address': 'Street {}'.format(i),
+        'cif': 'cif{}'.format(i),
+        'phone': 'phone{}'.format(i)
+    }
+
+
+def customer_row(i):
+    return {
+        'name': 'customer{}'.format(i),
+        'email': 'customer{}@example.com'.format(i),
+        'address': 'Street {}'.format(i),
+        'phone': 'phone{}'.format(i)
+    }
+
+
+'''
+best_of(fn, repeat)
+    runs fn repeat times and returns the fastest wall time in seconds
+'''
+def best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
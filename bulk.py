@@ -0,0 +1,188 @@
+import os
+from sqlalchemy import Float, String
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+
+# largest number of rows accepted by a bulk request
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', 5000))
+# values per IN (...) clause when looking for rows that already exist
+BULK_LOOKUP_CHUNK = 500
+
+
+'''
+validate_rows(model, rows)
+    checks every row against the columns of the model in a single pass
+    required (non nullable) columns must be non empty strings within the column length,
+    float columns take numbers (or numeric strings, as read from a CSV file) within the
+    range of the column info, unknown keys and ids are rejected (ids are assigned by the
+    database) as are the derived columns, which are computed from the other values,
+    and the version column (the database starts it at 1)
+    return the list of (index, values) of the valid rows and a dict index -> error
+'''
+def validate_rows(model, rows):
+    version = model.__mapper__.version_id_col
+    columns = [column for column in model.__table__.columns
+               if not column.primary_key and 'derive' not in column.info and column is not version]
+    derived = [column for column in model.__table__.columns if 'derive' in column.info]
+    known = set(column.name for column in columns)
+    valid = []
+    errors = {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index] = 'row must be an object'
+            continue
+        unknown = [key for key in row if key not in known]
+        if unknown:
+            errors[index] = 'unknown field {}'.format(unknown[0])
+            continue
+        error = None
+        values = {}
+        for column in columns:
+            value = row.get(column.name)
+            if value is None:
+                if not column.nullable:
+                    error = 'missing {}'.format(column.name)
+                    break
+            elif isinstance(column.type, String):
+                if not isinstance(value, str) or value == '':
+                    error = 'invalid {}'.format(column.name)
+                    break
+                if column.type.length is not None and len(value) > column.type.length:
+                    error = '{} is too long'.format(column.name)
+                    break
+            elif isinstance(column.type, Float):
+                value = _to_float(value)
+                bounds = column.info.get('range')
+                if value is None or (bounds is not None and not bounds[0] <= value <= bounds[1]):
+                    error = 'invalid {}'.format(column.name)
+                    break
+            values[column.name] = value
+        if error is not None:
+            errors[index] = error
+        else:
+            for column in derived:
+                values[column.name] = column.info['derive'](values)
+            valid.append((index, values))
+    return valid, errors
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    # nan and inf are not coordinates nor prices
+    return value if value - value == 0 else None
+
+
+'''
+unique_columns(model)
+    names of the columns of the model with a unique constraint, the primary key excluded
+'''
+def unique_columns(model):
+    return [column.name for column in model.__table__.columns
+            if column.unique and not column.primary_key]
+
+
+'''
+drop_conflicts(model, rows, errors)
+    removes the rows that repeat a unique value inside the batch or that already
+    exist in the table (one IN query per unique column and chunk)
+    the errors of the removed rows are added to errors
+    return the remaining (index, values) rows
+'''
+def drop_conflicts(model, rows, errors):
+    for name in unique_columns(model):
+        column = getattr(model, name)
+        seen = set()
+        for index, values in rows:
+            if values[name] in seen:
+                errors[index] = 'duplicate {}'.format(name)
+            seen.add(values[name])
+
+        candidates = sorted(seen)
+        existing = set()
+        for start in range(0, len(candidates), BULK_LOOKUP_CHUNK):
+            chunk = candidates[start:start + BULK_LOOKUP_CHUNK]
+            existing.update(value for (value,) in db.session.query(column).filter(column.in_(chunk)))
+        for index, values in rows:
+            if index not in errors and values[name] in existing:
+                errors[index] = '{} already exists'.format(name)
+
+        rows = [(index, values) for index, values in rows if index not in errors]
+    return rows
+
+
+'''
+bulk_insert(model, rows)
+    validates and inserts a batch of rows in one transaction
+    valid rows are written with a single multi-row INSERT (RETURNING on PostgreSQL,
+    executemany plus one lookup elsewhere); if another writer wins a unique value in
+    the meantime, the batch falls back to one savepoint per row (one transaction per
+    row on SQLite) so only the conflicting rows fail
+    return one result per input row, in order:
+        {'index': 0, 'success': True, 'id': 12}
+        {'index': 1, 'success': False, 'error': 'email already exists'}
+'''
+def bulk_insert(model, rows):
+    valid, errors = validate_rows(model, rows)
+    valid = drop_conflicts(model, valid, errors)
+
+    ids = {}
+    if valid:
+        try:
+            ids = _insert_all(model, valid)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            ids = _insert_one_by_one(model, valid, errors)
+            db.session.commit()
+
+    results = []
+    for index in range(len(rows)):
+        if index in ids:
+            results.append({'index': index, 'success': True, 'id': ids[index]})
+        else:
+            results.append({'index': index, 'success': False, 'error': errors[index]})
+    return results
+
+
+def _insert_all(model, rows):
+    table = model.__table__
+    key = unique_columns(model)[0]
+    values = [row for _, row in rows]
+    if db.engine.dialect.name == 'postgresql':
+        statement = table.insert().values(values).returning(table.c.id, table.c[key])
+        inserted = dict((row[1], row[0]) for row in db.session.execute(statement))
+    else:
+        db.session.execute(table.insert(), values)
+        column = getattr(model, key)
+        inserted = {}
+        keys = [row[key] for row in values]
+        for start in range(0, len(keys), BULK_LOOKUP_CHUNK):
+            chunk = keys[start:start + BULK_LOOKUP_CHUNK]
+            inserted.update((value, id) for id, value in
+                            db.session.query(model.id, column).filter(column.in_(chunk)))
+    return dict((index, inserted[row[key]]) for index, row in rows)
+
+
+def _insert_one_by_one(model, rows, errors):
+    table = model.__table__
+    # pysqlite handles its transactions itself, SAVEPOINT is only reliable with the
+    # isolation_level=None recipe of SQLAlchemy, which would also autocommit every row
+    # of the raw executemany of seeding.py: SQLite gets one transaction per row instead
+    per_row = db.engine.dialect.name == 'sqlite'
+    ids = {}
+    for index, values in rows:
+        transaction = db.session if per_row else db.session.begin_nested()
+        try:
+            result = db.session.execute(table.insert(), values)
+            transaction.commit()
+            ids[index] = result.inserted_primary_key[0]
+        except IntegrityError:
+            transaction.rollback()
+            errors[index] = 'unique constraint violated'
+    return ids
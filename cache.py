@@ -0,0 +1,220 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import request, Response
+
+from serializers import dumps
+
+# number of listing pages kept in memory
+LISTING_CACHE_SIZE = int(os.environ.get('LISTING_CACHE_SIZE', 256))
+# the caches and the table versions are per process: a write only invalidates the worker
+# that served it, the other workers keep answering from their copy until the ttl runs out
+# seconds a cached page is served at most, it bounds the staleness between workers
+LISTING_CACHE_TTL = int(os.environ.get('LISTING_CACHE_TTL', 5))
+# number of business / customer detail responses kept in memory
+ENTITY_CACHE_SIZE = int(os.environ.get('ENTITY_CACHE_SIZE', 4096))
+# seconds a detail response is cached, and seconds a missing id keeps answering 404,
+# they bound the staleness between workers as well
+ENTITY_CACHE_TTL = int(os.environ.get('ENTITY_CACHE_TTL', 5))
+ENTITY_CACHE_NEGATIVE_TTL = int(os.environ.get('ENTITY_CACHE_NEGATIVE_TTL', 2))
+
+
+## Table Versions
+
+'''
+TableVersions
+    per-table counters bumped by every write path of the application
+    a cached representation built at version n is valid as long as the version is n
+    the counters live in the process, the writes of the other workers do not bump them
+    EXAMPLE
+        business.insert()
+        table_versions.bump(Business.__tablename__)
+'''
+class TableVersions:
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, table):
+        return self._versions.get(table, 0)
+
+    def bump(self, table):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+
+table_versions = TableVersions()
+
+
+## Listing Cache
+
+'''
+ListingCache
+    bounded LRU of encoded listing pages with their strong ETag
+    keys contain the table version, a write makes every older page unreachable
+'''
+class ListingCache:
+    def __init__(self, maxsize=LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[2]:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0], entry[1]
+
+    def put(self, key, body):
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._entries[key] = (etag, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return etag, body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+listing_cache = ListingCache()
+
+
+'''
+cached_listing(table, variant, build)
+    answers a listing from the cache while the version of the table is unchanged
+    build() returns the body of the response, it only runs on a cache miss
+    a request whose If-None-Match holds the current ETag gets a 304 without
+    touching the database
+    EXAMPLE
+        return cached_listing('businesses', (limit, after), build_page)
+'''
+def cached_listing(table, variant, build):
+    key = (table, table_versions.get(table), variant)
+    entry = listing_cache.get(key)
+    if entry is None:
+        entry = listing_cache.put(key, dumps(build()))
+    etag, body = entry
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+## Cache Backends
+
+'''
+CacheBackend
+    storage used by the entity cache, keys are strings and values are bytes
+    so that a shared cache (memcached, redis) can implement it later
+    get(key) returns None on a miss, set(key, value, ttl) stores for ttl seconds
+'''
+class CacheBackend:
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+'''
+LRUCacheBackend
+    in-process, thread-safe LRU with a ttl per entry
+'''
+class LRUCacheBackend(CacheBackend):
+    def __init__(self, maxsize=ENTITY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+## Entity Cache
+
+# stored for ids that do not exist
+_NOT_FOUND = b''
+
+'''
+EntityCache
+    read-through cache of the encoded detail responses keyed by (model, id)
+    missing ids are cached too (negative entries) for negative_ttl seconds
+    the write handlers must call invalidate(model, id) after they commit
+    EXAMPLE
+        body = entity_cache.get_or_load(Business, id, load_business)
+        if body is None:
+            abort(404)
+'''
+class EntityCache:
+    def __init__(self, backend, ttl=ENTITY_CACHE_TTL, negative_ttl=ENTITY_CACHE_NEGATIVE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    '''
+    get_or_load(model, id, load)
+        returns the encoded body for the entity, load() builds it on a miss
+        load() returns the body to encode, or None when the entity does not exist
+        return None if the entity does not exist
+    '''
+    def get_or_load(self, model, id, load):
+        key = _entity_key(model, id)
+        body = self.backend.get(key)
+        if body is None:
+            data = load()
+            if data is None:
+                self.backend.set(key, _NOT_FOUND, self.negative_ttl)
+                return None
+            body = dumps(data)
+            self.backend.set(key, body, self.ttl)
+        if body == _NOT_FOUND:
+            return None
+        return body
+
+    def invalidate(self, model, id):
+        self.backend.delete(_entity_key(model, id))
+
+
+def _entity_key(model, id):
+    return '{}:{}'.format(model.__tablename__, id)
+
+
+entity_cache = EntityCache(LRUCacheBackend())
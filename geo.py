@@ -0,0 +1,143 @@
+import math
+
+# mean radius of the earth
+EARTH_RADIUS_KM = 6371.0088
+# kilometres per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# precision of the geohash stored with every business (cells of about 4.8 x 4.8 m)
+GEOHASH_PRECISION = 9
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# digits then letters sort the same way in the C collation and in the locale ones
+_ALPHANUMERIC = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+'''
+valid_coordinates(latitude, longitude)
+    True when both are numbers within [-90, 90] and [-180, 180]
+'''
+def valid_coordinates(latitude, longitude):
+    for value in (latitude, longitude):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+'''
+geohash_encode(latitude, longitude, precision)
+    the geohash of a point: the base32 code of the cell containing it,
+    points that share a prefix are in the same cell of that length
+    EXAMPLE
+        geohash_encode(40.4168, -3.7038, 5) == 'ezjmg'
+'''
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    code = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(code) < precision:
+        # bits alternate between longitude and latitude, longitude first
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            code.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(code)
+
+
+'''
+cell_size(precision)
+    (height, width) in degrees of the geohash cells of that length
+'''
+def cell_size(precision):
+    lat_bits = (5 * precision) // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+'''
+box_size(latitude, radius_km)
+    (half height, half width) in degrees of a box around the point containing the
+    circle of radius_km, the half width is None when the circle reaches a pole
+'''
+def box_size(latitude, radius_km):
+    lat_degrees = radius_km / KM_PER_DEGREE
+    # the circle is widest (in degrees of longitude) on its edge nearest to a pole
+    cos_edge = math.cos(math.radians(min(90.0, abs(latitude) + lat_degrees)))
+    if cos_edge < 1e-9:
+        return lat_degrees, None
+    return lat_degrees, radius_km / (KM_PER_DEGREE * cos_edge)
+
+
+'''
+search_precision(latitude, radius_km)
+    longest geohash length whose cells are at least radius_km high and wide at that
+    latitude, so the cell of a point and its 8 neighbours cover the whole circle
+    return 0 when not even the first level is large enough (a full scan is needed)
+'''
+def search_precision(latitude, radius_km):
+    lat_degrees, lon_degrees = box_size(latitude, radius_km)
+    if lon_degrees is None:
+        return 0
+    precision = 0
+    while precision < GEOHASH_PRECISION:
+        height, width = cell_size(precision + 1)
+        if height < lat_degrees or width < lon_degrees:
+            break
+        precision += 1
+    return precision
+
+
+'''
+covering_cells(latitude, longitude, precision)
+    the geohash of the cell containing the point and of its (up to) 8 neighbours
+'''
+def covering_cells(latitude, longitude, precision):
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        neighbour_latitude = latitude + dlat
+        if not -90 <= neighbour_latitude <= 90:
+            continue
+        for dlon in (-width, 0, width):
+            # wrap around the antimeridian
+            neighbour_longitude = (longitude + dlon + 180) % 360 - 180
+            cells.add(geohash_encode(neighbour_latitude, neighbour_longitude, precision))
+    return sorted(cells)
+
+
+'''
+prefix_range(cell)
+    (low, high) such that low <= code < high holds exactly for the geohashes
+    starting with cell, high is None for the last cell (no upper bound)
+    both are alphanumeric, so the range is an index range scan whatever the collation
+'''
+def prefix_range(cell):
+    prefix = cell.rstrip('z')
+    if not prefix:
+        return cell, None
+    return cell, prefix[:-1] + _ALPHANUMERIC[_ALPHANUMERIC.index(prefix[-1]) + 1]
+
+
+'''
+haversine_km(latitude1, longitude1, latitude2, longitude2)
+    great circle distance in kilometres between two points
+'''
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,32 @@
+'''
+gevent_app
+    cooperative serving mode: every worker process serves up to --worker-connections
+    requests at once on greenlets, a request waiting on PostgreSQL, Auth0 or a slow
+    client yields to the others instead of holding a whole process
+    RUN
+        gunicorn -k gevent --worker-connections 100 gevent_app:app
+    the stdlib (sockets, threading, time.sleep, urlopen) is patched before the
+    application is imported and psycopg2 gets the psycogreen wait callback, so the
+    Flask-SQLAlchemy sessions, the batch() depth and the cache locks are per greenlet
+    DB_POOL_SIZE + DB_MAX_OVERFLOW still bound the queries running at once per process
+'''
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+try:
+    from psycogreen.gevent import patch_psycopg
+except ImportError:
+    patch_psycopg = None
+
+if patch_psycopg is not None:
+    patch_psycopg()
+elif os.environ.get('DATABASE_URL', '').startswith('postgres'):
+    # without the wait callback every query would block all the greenlets of the worker
+    raise RuntimeError('gevent_app needs psycogreen to serve a PostgreSQL database (pip install psycogreen)')
+
+from app import app
+
+# gunicorn serves gevent_app:app
+__all__ = ['app']
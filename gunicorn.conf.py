@@ -0,0 +1,50 @@
+'''
+gunicorn.conf.py
+    settings of the production server, read by gunicorn from the working directory
+    RUN
+        gunicorn wsgi:app
+    the application is imported once by the master (preload_app) and warmed up there,
+    the workers are forked from it and share its memory until they write to it
+'''
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 8000))
+
+# sync, gthread or gevent (see gevent_app.py)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Heroku sets WEB_CONCURRENCY from the size of the dyno
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# gthread: requests served at once per worker, keep it below DB_POOL_SIZE + DB_MAX_OVERFLOW
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+# gevent: greenlets per worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+accesslog = '-'
+
+
+def when_ready(server):
+    # the master has loaded the app (preload), the workers are not forked yet
+    if preload_app:
+        from wsgi import app, warm_up
+        warm_up(app)
+        server.log.info('caches warmed up in the master')
+
+
+def post_fork(server, worker):
+    # never use a connection opened before the fork, it would be shared with the
+    # master and the other workers
+    from models import db
+    from wsgi import app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    # without preload every worker loads and warms up its own copy of the app
+    if not preload_app:
+        from wsgi import app, warm_up
+        warm_up(app)
@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from models import db
+from bulk import validate_rows
+
+# rows read, validated and written per round
+IMPORT_CHUNK_SIZE = 5000
+
+
+'''
+read_rows(path, format)
+    lazily yields the rows of a CSV (with a header line) or NDJSON file as dicts
+    format is 'csv' or 'ndjson', guessed from the extension when not given
+'''
+def read_rows(path, format=None):
+    if format is None:
+        format = 'ndjson' if path.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as source:
+        if format == 'csv':
+            for row in csv.DictReader(source):
+                # empty cells are missing values, not empty strings
+                yield dict((key, value) for key, value in row.items() if value != '')
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+'''
+chunked(rows, size)
+    yields lists of at most size rows, only one chunk is held in memory
+'''
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+'''
+import_rows(model, rows, chunk_size, progress)
+    streams rows into the table of the model, one transaction per chunk
+    invalid rows and rows that collide with a unique column are skipped
+    PostgreSQL: COPY FROM STDIN into a temporary staging table, then
+                INSERT ... SELECT ... ON CONFLICT DO NOTHING
+    other databases: batched executemany of INSERT OR IGNORE
+    progress(stats) is called after every chunk
+    return the stats: read, inserted, invalid, conflicts, seconds, rows_per_second
+'''
+def import_rows(model, rows, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    # the version column keeps its default
+    version = model.__mapper__.version_id_col
+    columns = [column.name for column in model.__table__.columns
+               if not column.primary_key and column is not version]
+    if db.engine.dialect.name == 'postgresql':
+        writer = _PostgresCopyWriter(model.__tablename__, columns)
+    else:
+        writer = _ExecutemanyWriter(model.__table__)
+
+    stats = {'read': 0, 'inserted': 0, 'invalid': 0, 'conflicts': 0}
+    start = time.perf_counter()
+    try:
+        for chunk in chunked(rows, chunk_size):
+            valid, errors = validate_rows(model, chunk)
+            inserted = writer.write([values for _, values in valid]) if valid else 0
+
+            stats['read'] += len(chunk)
+            stats['invalid'] += len(errors)
+            stats['inserted'] += inserted
+            stats['conflicts'] += len(valid) - inserted
+            _add_rate(stats, start)
+            if progress is not None:
+                progress(stats)
+    finally:
+        writer.close()
+
+    _add_rate(stats, start)
+    return stats
+
+
+def _add_rate(stats, start):
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['read'] / stats['seconds'] if stats['seconds'] else 0.0
+
+
+class _ExecutemanyWriter:
+    def __init__(self, table):
+        self.table = table
+        self.statement = table.insert().prefix_with('OR IGNORE', dialect='sqlite')
+
+    def write(self, rows):
+        result = db.session.execute(self.statement, rows)
+        db.session.commit()
+        return result.rowcount
+
+    def close(self):
+        db.session.remove()
+
+
+class _PostgresCopyWriter:
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.staging = '{}_import'.format(table)
+        self.connection = db.engine.raw_connection()
+        cursor = self.connection.cursor()
+        # only the imported columns, copying the id default would burn sequence values
+        cursor.execute('CREATE TEMPORARY TABLE IF NOT EXISTS {} AS SELECT {} FROM {} WITH NO DATA'.format(
+            self.staging, ', '.join(columns), table))
+        self.connection.commit()
+
+    def write(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in self.columns])
+        buffer.seek(0)
+
+        column_list = ', '.join(self.columns)
+        cursor = self.connection.cursor()
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(self.staging, column_list), buffer)
+        cursor.execute('INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} '
+                       'ON CONFLICT DO NOTHING'.format(table=self.table, columns=column_list,
+                                                       staging=self.staging))
+        inserted = cursor.rowcount
+        cursor.execute('TRUNCATE {}'.format(self.staging))
+        self.connection.commit()
+        return inserted
+
+    def close(self):
+        # the connection goes back to the pool, the staging table must not outlive the import
+        self.connection.rollback()
+        self.connection.cursor().execute('DROP TABLE IF EXISTS {}'.format(self.staging))
+        self.connection.commit()
+        self.connection.close()
@@ -1,8 +1,14 @@
+import os
+# the migrations own the schema, importing the app must not create the tables first
+os.environ.setdefault('DB_SCHEMA_MODE', 'migrations')
+
 from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import Migrate, MigrateCommand, stamp
 
 from app import app
-from models import db
+from models import db, Business, Customer
+from importer import IMPORT_CHUNK_SIZE, import_rows, read_rows
+from seeding import SEED_PROFILES, seed_database
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -10,5 +16,71 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+'''
+init_db
+    creates the tables of an empty database and stamps it with the latest migration,
+    the first migration only alters existing tables so upgrade cannot start from nothing
+    EXAMPLE
+        python manage.py init_db
+        python manage.py db upgrade   # every deploy after that
+'''
+@manager.option('--revision', dest='revision', default='head', help='migration the new schema corresponds to')
+def init_db(revision='head'):
+    db.create_all()
+    stamp(revision=revision)
+
+
+'''
+import_data
+    streams a CSV or NDJSON file into the customers (or businesses) table
+    EXAMPLE
+        python manage.py import_data -f customers.csv
+        python manage.py import_data -f businesses.ndjson --table businesses --chunk-size 10000
+'''
+@manager.option('-f', '--file', dest='path', required=True, help='CSV (with header) or NDJSON file')
+@manager.option('--format', dest='format', default=None, choices=['csv', 'ndjson'])
+@manager.option('--table', dest='table', default='customers', choices=['customers', 'businesses'])
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=IMPORT_CHUNK_SIZE)
+def import_data(path, format=None, table='customers', chunk_size=IMPORT_CHUNK_SIZE):
+    model = Customer if table == 'customers' else Business
+
+    def progress(stats):
+        print('{read} rows read, {inserted} inserted, {invalid} invalid, {conflicts} conflicts, '
+              '{rows_per_second:.0f} rows/s'.format(**stats))
+
+    stats = import_rows(model, read_rows(path, format), chunk_size, progress)
+    print('done in {seconds:.1f} s'.format(**stats))
+
+
+'''
+seed
+    fills an empty database with deterministic synthetic businesses, customers and products
+    the profile gives the number of rows per table (small, medium, large), the options override it
+    EXAMPLE
+        python manage.py seed --profile medium --seed 42
+        python manage.py seed --profile small --customers 500000 --processes 4
+'''
+@manager.option('--profile', dest='profile', default='small', choices=sorted(SEED_PROFILES))
+@manager.option('--seed', dest='random_seed', type=int, default=0, help='same seed, same data')
+@manager.option('--processes', dest='processes', type=int, default=None, help='row generating processes (CPUs)')
+@manager.option('--businesses', dest='businesses', type=int, default=None)
+@manager.option('--customers', dest='customers', type=int, default=None)
+@manager.option('--products', dest='products', type=int, default=None)
+def seed(profile='small', random_seed=0, processes=None, businesses=None, customers=None, products=None):
+    counts = dict(SEED_PROFILES[profile])
+    for table, count in (('businesses', businesses), ('customers', customers), ('products', products)):
+        if count is not None:
+            counts[table] = count
+
+    def progress(table, stats):
+        done = stats['rows'] == counts[table]
+        print('\r{}: {rows} rows, {rows_per_second:.0f} rows/s'.format(table, **stats),
+              end='\n' if done else '', flush=True)
+
+    results = seed_database(counts, random_seed, processes, progress)
+    for table, stats in results.items():
+        print('{}: {rows} rows in {seconds:.1f} s, {rows_per_second:.0f} rows/s'.format(table, **stats))
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
@@ -0,0 +1,314 @@
+import os
+import threading
+from bisect import bisect_left
+import time
+from functools import wraps
+from flask import Response, request
+from sqlalchemy.engine import Engine
+from werkzeug.wsgi import ClosingIterator
+import sqltiming
+
+# off by default: nothing is hooked into the requests or the engine
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQL statements per request
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# parts of a request timed separately, 'app' is the rest of the request
+PHASES = ('auth', 'db', 'serialize', 'app')
+
+
+## Metric Types
+
+'''
+Counter
+    monotonic value per combination of label values
+    EXAMPLE
+        requests = Counter('requests_total', 'Requests served', ('route',))
+        requests.inc(('/businesses',))
+'''
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+'''
+Histogram
+    cumulative buckets, sum and count of the observed values per combination of label values
+'''
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        # one count per bucket (the last one is +Inf), made cumulative when rendered
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, entry in self._values.items():
+                count = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), entry):
+                    count += bucket_count
+                    samples.append((self.name + '_bucket', labels + (_format_value(bound),), count))
+                samples.append((self.name + '_sum', labels, entry[-1]))
+                samples.append((self.name + '_count', labels, count))
+        return samples
+
+    def label_names_of(self, sample_name):
+        return self.labelnames + ('le',) if sample_name.endswith('_bucket') else self.labelnames
+
+
+'''
+Registry
+    the metrics of the process and the collectors (functions returning
+    (name, type, help, labelnames, [(labels, value)]) tuples) read at scrape time
+'''
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    '''
+    render()
+        every metric in the Prometheus text exposition format
+    '''
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                names = metric.label_names_of(name) if hasattr(metric, 'label_names_of') else metric.labelnames
+                lines.append(_sample_line(name, names, labels, value))
+        for collector in self.collectors:
+            for name, type, help, labelnames, values in collector():
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} {}'.format(name, type))
+                for labels, value in values:
+                    lines.append(_sample_line(name, labelnames, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _sample_line(name, labelnames, labels, value):
+    # every worker process exports its own series
+    pairs = [('worker', str(os.getpid()))] + list(zip(labelnames, labels))
+    label_text = ','.join('{}="{}"'.format(key, _escape(label)) for key, label in pairs)
+    return '{}{{{}}} {}'.format(name, label_text, _format_value(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to answer a request, writing the response included',
+    ('route', 'method', 'status')))
+request_phase_duration = registry.register(Histogram(
+    'http_request_phase_seconds', 'Time spent per request in token verification (auth), SQL (db), '
+    'JSON encoding (serialize) and everything else (app)', ('route', 'phase')))
+request_statements = registry.register(Histogram(
+    'db_statements_per_request', 'SQL statements executed per request', ('route',), COUNT_BUCKETS))
+jwks_fetch_duration = registry.register(Histogram(
+    'jwks_fetch_duration_seconds', 'Time to fetch the JSON Web Key Set', ('outcome',)))
+
+
+## Request Timing
+
+# the timer of the request served by the current thread (greenlet under gevent)
+_request = threading.local()
+
+
+class RequestTimer:
+    def __init__(self, method):
+        self.start = time.perf_counter()
+        self.method = method
+        self.route = 'unmatched'
+        self.status = '000'
+        self.statements = 0
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+
+    def finish(self):
+        total = time.perf_counter() - self.start
+        self.phases['app'] = max(0.0, total - self.phases['auth'] - self.phases['db'] - self.phases['serialize'])
+        request_duration.observe((self.route, self.method, self.status), total)
+        for phase, seconds in self.phases.items():
+            request_phase_duration.observe((self.route, phase), seconds)
+        request_statements.observe((self.route,), self.statements)
+        if getattr(_request, 'timer', None) is self:
+            _request.timer = None
+
+
+'''
+timed_phase(phase)
+    decorator adding the time spent in the function to a phase of the current request
+    the function is always wrapped (install() can turn the metrics on after the import),
+    outside a timed request the wrapper only looks the timer up
+    EXAMPLE
+        @timed_phase('auth')
+        def authorize(permission):
+            ...
+'''
+def timed_phase(phase):
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            timer = getattr(_request, 'timer', None)
+            if timer is None:
+                return f(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                timer.phases[phase] += time.perf_counter() - start
+        return wrapper
+    return decorator
+
+
+'''
+MetricsMiddleware
+    WSGI middleware timing every request until its response has been written
+'''
+class MetricsMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        timer = _request.timer = RequestTimer(environ.get('REQUEST_METHOD', 'GET'))
+
+        def recording_start_response(status, headers, exc_info=None):
+            timer.status = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        try:
+            response = self.wsgi_app(environ, recording_start_response)
+        except Exception:
+            timer.finish()
+            raise
+        return ClosingIterator(response, timer.finish)
+
+
+def _count_statement(conn, statement, parameters, executemany, seconds):
+    timer = getattr(_request, 'timer', None)
+    if timer is not None:
+        timer.phases['db'] += seconds
+        timer.statements += 1
+
+
+_engine_events_installed = False
+
+
+## Install
+
+'''
+install(app)
+    turns the instrumentation on for the application when METRICS_ENABLED is set:
+    the request timing middleware, the SQL events of every engine and GET /metrics
+    (the serializers and auth.py time their phase through timed_phase)
+'''
+def install(app, enabled=None):
+    global _engine_events_installed
+    if not (METRICS_ENABLED if enabled is None else enabled):
+        return
+
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+
+    @app.before_request
+    def name_route():
+        timer = getattr(_request, 'timer', None)
+        if timer is not None and request.url_rule is not None:
+            timer.route = request.url_rule.rule
+
+    @app.route('/metrics')
+    def get_metrics():
+        return Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+    if not _engine_events_installed:
+        sqltiming.listen(Engine, _count_statement)
+        registry.add_collector(_cache_metrics)
+        registry.add_collector(_pool_metrics)
+        _engine_events_installed = True
+
+
+## Collectors
+
+def _cache_metrics():
+    # imported here: auth.py and cache.py time their work through this module
+    from auth import jwks_cache, token_cache
+    from cache import listing_cache, entity_cache
+    caches = (('jwks', jwks_cache.stats), ('token', token_cache.stats),
+              ('listing', listing_cache.stats), ('entity', getattr(entity_cache.backend, 'stats', {})))
+    lookups = []
+    for cache, stats in caches:
+        for result, key in (('hit', 'hits'), ('miss', 'misses')):
+            if key in stats:
+                lookups.append(((cache, result), stats[key]))
+    return [('cache_lookups_total', 'counter', 'Cache lookups by cache and result', ('cache', 'result'), lookups),
+            ('jwks_refreshes_total', 'counter', 'Key sets fetched and stored', (),
+             [((), jwks_cache.stats['refreshes'])])]
+
+
+def _pool_metrics():
+    from models import db
+    from pool import pool_stats
+    stats = pool_stats(db.engine)
+    if 'size' not in stats:
+        return []
+    metrics = [
+        ('db_pool_size', 'gauge', 'Connections kept open by the pool', (), [((), stats['size'])]),
+        ('db_pool_connections', 'gauge', 'Connections of the pool by state', ('state',),
+         [((state,), stats[state]) for state in ('in_use', 'idle', 'overflow')])
+    ]
+    if 'checkouts' in stats:
+        metrics += [
+            ('db_pool_checkouts_total', 'counter', 'Connections taken from the pool', (),
+             [((), stats['checkouts'])]),
+            ('db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a connection', (),
+             [((), stats['timeouts'])]),
+            ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection', (),
+             [((), stats['wait_seconds'])])
+        ]
+    return metrics
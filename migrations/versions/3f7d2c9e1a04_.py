@@ -0,0 +1,51 @@
+"""business search index
+
+Revision ID: 3f7d2c9e1a04
+Revises: 8c3e1f4a2b6d
+Create Date: 2026-10-18 11:02:17.538021
+
+"""
+import sqlite3
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7d2c9e1a04'
+down_revision = '8c3e1f4a2b6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_businesses_name_trgm ON businesses USING gin (name gin_trgm_ops)')
+        op.execute('CREATE INDEX IF NOT EXISTS ix_businesses_address_trgm ON businesses USING gin (address gin_trgm_ops)')
+    elif dialect == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34, 0):
+        # no trigram tokenizer before SQLite 3.34, the search then scans with LIKE
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS businesses_fts USING fts5(name, address, "
+                   "content='businesses', content_rowid='id', tokenize='trigram')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS businesses_fts_insert AFTER INSERT ON businesses BEGIN "
+                   "INSERT INTO businesses_fts(rowid, name, address) VALUES (new.id, new.name, new.address); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS businesses_fts_delete AFTER DELETE ON businesses BEGIN "
+                   "INSERT INTO businesses_fts(businesses_fts, rowid, name, address) "
+                   "VALUES ('delete', old.id, old.name, old.address); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS businesses_fts_update AFTER UPDATE OF name, address ON businesses BEGIN "
+                   "INSERT INTO businesses_fts(businesses_fts, rowid, name, address) "
+                   "VALUES ('delete', old.id, old.name, old.address); "
+                   "INSERT INTO businesses_fts(rowid, name, address) VALUES (new.id, new.name, new.address); END")
+        # index the businesses that already exist
+        op.execute("INSERT INTO businesses_fts(businesses_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_businesses_address_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_businesses_name_trgm')
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS businesses_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS businesses_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS businesses_fts_insert')
+        op.execute('DROP TABLE IF EXISTS businesses_fts')
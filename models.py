@@ -1,28 +1,60 @@
 import os
-from sqlalchemy import Column, String, Integer
+import sqlite3
+import threading
+from contextlib import contextmanager
+from sqlalchemy import Column, String, Integer, DDL, event
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-import json
+from serializers import dumps
+from geo import geohash_encode
+from pool import engine_options
+from slowlog import slow_query_log
 
 #database_name = "i_buy_local"
 #database_path = "postgres://{}:{}@{}/{}".format('postgres','EresTonto','localhost:5432', database_name)
 #database_path = os.environ.get('DATABASE_URL', database_path)
 database_path = os.environ.get('DATABASE_URL')
 
+# create_all: setup_db creates the missing tables, once per process and database
+# migrations: the schema belongs to the Alembic migrations (python manage.py db upgrade),
+#             setup_db does not touch the database and the first query opens the first connection
+DB_SCHEMA_MODE = os.environ.get('DB_SCHEMA_MODE', 'create_all')
+
 db = SQLAlchemy()
 
+# databases whose tables were created by this process
+_created_schemas = set()
+
+# depth of the batch() blocks open in the current thread
+_unit_of_work = threading.local()
+
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the connection pool is configured from the DB_POOL_* settings (see pool.py),
+    SQLALCHEMY_ENGINE_OPTIONS already in the app config take precedence
+    the tables are created or not according to DB_SCHEMA_MODE (or the app config key of that name)
+    with SLOW_QUERY_THRESHOLD_MS set the slow statements of the engine are recorded (see slowlog.py)
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=None):
+    if database_path is None:
+        # DATABASE_URL as it is when the app is created, not when models.py was imported
+        database_path = os.environ.get('DATABASE_URL')
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    options = engine_options(database_path)
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
     db.app = app
     db.init_app(app)
-    db.create_all()
-    migrate = Migrate(app, db)
+    schema_mode = app.config.get("DB_SCHEMA_MODE", DB_SCHEMA_MODE)
+    if schema_mode == 'create_all' and database_path not in _created_schemas:
+        db.create_all()
+        _created_schemas.add(database_path)
+    if slow_query_log.enabled:
+        # building the engine does not connect yet
+        slow_query_log.install(db.get_engine(app))
+    # Flask-Migrate (and alembic) are only loaded by manage.py, workers never need them
 
 
 '''
@@ -35,6 +67,56 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+batch()
+    unit of work for the insert(), update() and delete() helpers
+    inside the block the helpers only stage their changes, everything is
+    committed once when the block exits and rolled back if it raises
+    blocks can be nested, only the outermost one commits
+    EXAMPLE
+        with batch():
+            for row in rows:
+                Business(**row).insert()
+            old_business.delete()
+'''
+@contextmanager
+def batch():
+    depth = getattr(_unit_of_work, 'depth', 0)
+    _unit_of_work.depth = depth + 1
+    try:
+        yield db.session
+        if depth == 0:
+            db.session.commit()
+    except:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        _unit_of_work.depth = depth
+
+'''
+in_batch()
+    True inside a batch() block of the current thread
+'''
+def in_batch():
+    return getattr(_unit_of_work, 'depth', 0) > 0
+
+def _commit():
+    # a batch() block commits on exit
+    if not in_batch():
+        db.session.commit()
+
+'''
+projected_query(model, fields)
+    query selecting only the given columns of the model
+    rows come back as plain tuples, they skip the identity map and the change tracking
+    see serializers.serializer_for to turn the rows into representations
+    EXAMPLE
+        rows = projected_query(Business, Business.SHORT_FIELDS).all()
+'''
+def projected_query(model, fields):
+    return db.session.query(*[getattr(model, field) for field in fields])
+
 '''
 Business
 a persistent business entity, extends the base SQLAlchemy Model
@@ -48,7 +130,25 @@ class Business(db.Model):
     address = db.Column(db.String(120), nullable=False)
     cif = db.Column(db.String(40), unique=True, nullable=False)
     phone = db.Column(db.String(20), unique=True, nullable=False)
-
+    latitude = db.Column(db.Float, nullable=True, info={'range': (-90, 90)})
+    longitude = db.Column(db.Float, nullable=True, info={'range': (-180, 180)})
+    # derived from latitude and longitude on every write, never sent by clients
+    # GET /businesses/near scans the ranges of the cells around a point on this index
+    geohash = db.Column(db.String(12), nullable=True, index=True,
+                        info={'derive': lambda values: business_geohash(values.get('latitude'), values.get('longitude'))})
+    # bumped by every write, PATCH and DELETE compare it with the If-Match header
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # lazy by default, use selectinload(Business.products) to load the products
+    # of a page of businesses with a single extra query
+    products = db.relationship('Product', backref='business', order_by='Product.id',
+                               cascade='all, delete-orphan')
+
+    # the ORM writes check and bump the version too
+    __mapper_args__ = {'version_id_col': version}
+
+    # columns exposed by short() and long()
+    SHORT_FIELDS = ('id', 'name', 'email', 'phone', 'address')
+    LONG_FIELDS = ('id', 'name', 'email', 'phone', 'address', 'cif', 'latitude', 'longitude', 'version')
 
     '''
     short()
@@ -74,12 +174,15 @@ class Business(db.Model):
             'email': self.email,
             'phone': self.phone,
             'address': self.address,
-            'cif': self.cif
+            'cif': self.cif,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'version': self.version
         }
 
     '''
     insert()
-        inserts a new model into a database
+        inserts a new model into a database (staged only inside a batch() block)
         the model must have a unique name
         the model must have a unique id or null id
         EXAMPLE
@@ -88,11 +191,11 @@ class Business(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        _commit()
 
     '''
     delete()
-        deletes a new model into a database
+        deletes a new model into a database (staged only inside a batch() block)
         the model must exist in the database
         EXAMPLE
             drink = Drink(title=req_title, recipe=req_recipe)
@@ -100,11 +203,11 @@ class Business(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        _commit()
 
     '''
     update()
-        updates a new model into a database
+        updates a new model into a database (staged only inside a batch() block)
         the model must exist in the database
         EXAMPLE
             business = Business.query.filter(business.id == id).one_or_none()
@@ -112,11 +215,70 @@ class Business(db.Model):
             business.update()
     '''
     def update(self):
-        db.session.commit()
+        _commit()
 
 
     def __repr__(self):
-        return json.dumps(self.long())
+        return dumps(self.long()).decode('utf-8')
+
+
+'''
+business_geohash(latitude, longitude)
+    the stored geohash of a business, None while it has no coordinates
+'''
+def business_geohash(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return geohash_encode(latitude, longitude)
+
+
+# ORM writes (the routes), bulk inserts and imports go through the 'derive' info of the column
+@event.listens_for(Business, 'before_insert')
+@event.listens_for(Business, 'before_update')
+def _set_business_geohash(mapper, connection, business):
+    business.geohash = business_geohash(business.latitude, business.longitude)
+
+
+## Search index
+
+# the trigram tokenizer of FTS5 came with SQLite 3.34, older libraries get no index
+# and search.py answers every query with a LIKE scan
+SQLITE_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+# SQLite: FTS5 trigram index over name and address, an external content table
+# kept in sync by triggers so bulk inserts and imports are indexed as well
+SQLITE_SEARCH_DDL = (
+    "DROP TABLE IF EXISTS businesses_fts",
+    "CREATE VIRTUAL TABLE businesses_fts USING fts5(name, address, "
+    "content='businesses', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER businesses_fts_insert AFTER INSERT ON businesses BEGIN "
+    "INSERT INTO businesses_fts(rowid, name, address) VALUES (new.id, new.name, new.address); END",
+    "CREATE TRIGGER businesses_fts_delete AFTER DELETE ON businesses BEGIN "
+    "INSERT INTO businesses_fts(businesses_fts, rowid, name, address) "
+    "VALUES ('delete', old.id, old.name, old.address); END",
+    "CREATE TRIGGER businesses_fts_update AFTER UPDATE OF name, address ON businesses BEGIN "
+    "INSERT INTO businesses_fts(businesses_fts, rowid, name, address) "
+    "VALUES ('delete', old.id, old.name, old.address); "
+    "INSERT INTO businesses_fts(rowid, name, address) VALUES (new.id, new.name, new.address); END",
+)
+# PostgreSQL: trigram GIN indexes, they serve ILIKE '%q%' and similarity()
+POSTGRES_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_businesses_name_trgm ON businesses USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_businesses_address_trgm ON businesses USING gin (address gin_trgm_ops)",
+)
+
+
+def _sqlite_trigram(ddl, target, bind, **kw):
+    return SQLITE_TRIGRAM
+
+
+# create_all() builds the index with the table, migration 3f7d2c9e1a04 on existing databases
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Business.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite', callable_=_sqlite_trigram))
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(Business.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
 
 
 '''
@@ -131,6 +293,14 @@ class Customer(db.Model):
     email = db.Column(db.String(80), unique=True, nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(20), unique=True, nullable=False)
+    # bumped by every write, DELETE compares it with the If-Match header
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    # columns exposed by short() and long()
+    SHORT_FIELDS = ('id', 'name', 'email', 'phone')
+    LONG_FIELDS = ('id', 'name', 'email', 'phone', 'address', 'version')
 
     '''
     short()
@@ -154,12 +324,13 @@ class Customer(db.Model):
             'name': self.name,
             'email': self.email,
             'phone': self.phone,
-            'address': self.address
+            'address': self.address,
+            'version': self.version
         }
 
     '''
     insert()
-        inserts a new model into a database
+        inserts a new model into a database (staged only inside a batch() block)
         the model must have a unique name
         the model must have a unique id or null id
         EXAMPLE
@@ -168,11 +339,11 @@ class Customer(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        _commit()
 
     '''
     delete()
-        deletes a new model into a database
+        deletes a new model into a database (staged only inside a batch() block)
         the model must exist in the database
         EXAMPLE
             drink = Drink(title=req_title, recipe=req_recipe)
@@ -180,11 +351,11 @@ class Customer(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        _commit()
 
     '''
     update()
-        updates a new model into a database
+        updates a new model into a database (staged only inside a batch() block)
         the model must exist in the database
         EXAMPLE
             business = Business.query.filter(business.id == id).one_or_none()
@@ -192,20 +363,22 @@ class Customer(db.Model):
             business.update()
     '''
     def update(self):
-        db.session.commit()
+        _commit()
 
 
     def __repr__(self):
-        return json.dumps(self.long())
+        return dumps(self.long()).decode('utf-8')
 
 
 
 '''
 Products
-a persistent customer entity, extends the base SQLAlchemy Model
+a persistent product entity of a business catalog, extends the base SQLAlchemy Model
 '''
 class Product(db.Model):
     __tablename__ = 'products'
+    # catalog of a business: WHERE business_id = ? AND id > ? ORDER BY id is an index range scan
+    __table_args__ = (db.Index('ix_products_business_id_id', 'business_id', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(40), unique=True, nullable=False)
@@ -213,6 +386,10 @@ class Product(db.Model):
     available = db.Column(db.Boolean, default=False, nullable=True)
     business_id = db.Column(db.Integer, db.ForeignKey('businesses.id'), nullable=False)
 
+    # columns exposed by short() and long()
+    SHORT_FIELDS = ('id', 'name', 'price', 'available', 'business_id')
+    LONG_FIELDS = ('id', 'name', 'price', 'available', 'business_id')
+
     '''
     short()
         short form representation of the customer model
@@ -241,7 +418,7 @@ class Product(db.Model):
 
     '''
     insert()
-        inserts a new model into a database
+        inserts a new model into a database (staged only inside a batch() block)
         the model must have a unique name
         the model must have a unique id or null id
         EXAMPLE
@@ -250,11 +427,11 @@ class Product(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        _commit()
 
     '''
     delete()
-        deletes a new model into a database
+        deletes a new model into a database (staged only inside a batch() block)
         the model must exist in the database
         EXAMPLE
             drink = Drink(title=req_title, recipe=req_recipe)
@@ -262,11 +439,11 @@ class Product(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        _commit()
 
     '''
     update()
-        updates a new model into a database
+        updates a new model into a database (staged only inside a batch() block)
         the model must exist in the database
         EXAMPLE
             business = Business.query.filter(business.id == id).one_or_none()
@@ -274,8 +451,8 @@ class Product(db.Model):
             business.update()
     '''
     def update(self):
-        db.session.commit()
+        _commit()
 
 
     def __repr__(self):
-        return json.dumps(self.long())
\ No newline at end of file
+        return dumps(self.long()).decode('utf-8')
\ No newline at end of file
@@ -0,0 +1,80 @@
+import base64
+import json
+import os
+from flask import request, abort
+
+# page size used when the client does not send a limit
+PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', 50))
+# largest page the server accepts, bigger limits are clamped to it
+PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', 200))
+
+
+'''
+encode_cursor(last_id)
+    opaque cursor pointing right after the row last_id
+'''
+def encode_cursor(last_id):
+    raw = json.dumps({'after': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+'''
+decode_cursor(cursor)
+    returns the id stored in a cursor made by encode_cursor
+    it should raise a ValueError if the cursor is malformed
+'''
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_id = json.loads(raw.decode('utf-8'))['after']
+    except Exception:
+        raise ValueError('invalid cursor')
+    # bool is an int and the id must fit a BIGINT
+    if type(last_id) is not int or not 0 <= last_id < 2 ** 63:
+        raise ValueError('invalid cursor')
+    return last_id
+
+
+'''
+page_args()
+    reads the limit and after query parameters of the current request
+    it should abort 400 if limit is not a positive integer or after is not a valid cursor
+    return the (limit, after id) pair, limit is clamped to PAGE_SIZE_MAX
+'''
+def page_args():
+    limit = request.args.get('limit', None)
+    try:
+        limit = PAGE_SIZE_DEFAULT if limit is None else int(limit)
+    except ValueError:
+        abort(400)
+    if limit < 1:
+        abort(400)
+
+    after = request.args.get('after', None)
+    if after is not None:
+        try:
+            after = decode_cursor(after)
+        except ValueError:
+            abort(400)
+
+    return min(limit, PAGE_SIZE_MAX), after
+
+
+'''
+paginate(query, column, limit, after)
+    keyset pagination on a unique, indexed column (the primary key)
+    every page is a range scan of limit + 1 rows, page 10000 costs as much as page 1
+    return the rows of the page and the cursor of the next one (None on the last page)
+    EXAMPLE
+        businesses, next_cursor = paginate(Business.query, Business.id, *page_args())
+'''
+def paginate(query, column, limit, after=None):
+    if after is not None:
+        query = query.filter(column > after)
+    rows = query.order_by(column).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], column.key))
+    return rows, next_cursor
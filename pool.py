@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+# connections kept open per process, and extra ones opened under load
+# every worker process has its own pool: workers * (size + overflow) must stay
+# below max_connections of the database server
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# seconds after which a connection is replaced, below the idle timeouts of the server and proxies
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# test every connection on checkout, a failover then costs one reconnect instead of a 500
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+
+'''
+InstrumentedQueuePool
+    QueuePool that measures how long the checkouts wait for a free connection
+'''
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = {'checkouts': 0, 'timeouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            with self._stats_lock:
+                self.wait_stats['timeouts'] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_stats['checkouts'] += 1
+                self.wait_stats['wait_seconds'] += waited
+                self.wait_stats['max_wait_seconds'] = max(self.wait_stats['max_wait_seconds'], waited)
+
+    def recreate(self):
+        # dispose() builds a new pool: the counters carry over, and so does pre-ping
+        # (QueuePool.recreate does not pass it on)
+        pool = super().recreate()
+        pool._pre_ping = self._pre_ping
+        pool.wait_stats = self.wait_stats
+        pool._stats_lock = self._stats_lock
+        return pool
+
+
+'''
+engine_options(database_uri)
+    SQLALCHEMY_ENGINE_OPTIONS for the database from the DB_POOL_* settings
+    SQLite keeps the pool chosen by SQLAlchemy, the sizes do not apply to it
+'''
+def engine_options(database_uri):
+    if database_uri is None or make_url(database_uri).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+
+
+'''
+pool_stats(engine)
+    state of the connection pool of the engine in this process
+    in_use and idle connections, configured size and current overflow, and for the
+    instrumented pool the checkouts, timeouts and time waited for a connection
+'''
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(0, pool.overflow())
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        wait_stats = dict(pool.wait_stats)
+        checkouts = wait_stats['checkouts']
+        wait_stats['mean_wait_seconds'] = wait_stats['wait_seconds'] / checkouts if checkouts else 0.0
+        stats.update(wait_stats)
+    return stats
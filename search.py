@@ -0,0 +1,175 @@
+import heapq
+import os
+import weakref
+from flask import request, abort
+from sqlalchemy import and_, case, func, inspect, literal_column, or_, select
+from sqlalchemy.sql import table, column
+
+from models import db, projected_query, Business
+from geo import valid_coordinates, box_size, search_precision, covering_cells, prefix_range, haversine_km
+from pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+
+# longest accepted search text
+SEARCH_MAX_LENGTH = int(os.environ.get('SEARCH_MAX_LENGTH', 100))
+# the trigram index only answers queries of at least 3 characters,
+# shorter ones fall back to a LIKE scan
+TRIGRAM_MIN_LENGTH = 3
+
+# radius of GET /businesses/near when none is sent, and the largest accepted
+NEAR_RADIUS_DEFAULT_KM = float(os.environ.get('NEAR_RADIUS_DEFAULT_KM', 5))
+NEAR_RADIUS_MAX_KM = float(os.environ.get('NEAR_RADIUS_MAX_KM', 50))
+# radius of the first round of a nearby search
+NEAR_START_RADIUS_KM = 0.5
+
+# the FTS5 shadow table of businesses (see models.SQLITE_SEARCH_DDL)
+_businesses_fts = table('businesses_fts', column('rowid'))
+# engine -> whether its database has the FTS5 table, it is missing when the
+# tables were created by a SQLite older than 3.34 (see models.SQLITE_TRIGRAM)
+_fts_engines = weakref.WeakKeyDictionary()
+
+
+## Text search
+
+'''
+search_args()
+    reads q and limit from the query string of the current request
+    aborts with 400 when q is missing, blank or too long, or limit is not a positive integer
+'''
+def search_args():
+    q = request.args.get('q', '').strip()
+    if q == '' or len(q) > SEARCH_MAX_LENGTH:
+        abort(400)
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE_DEFAULT))
+    except ValueError:
+        abort(400)
+    if limit < 1:
+        abort(400)
+    return q, min(limit, PAGE_SIZE_MAX)
+
+
+'''
+search_businesses(q, fields, limit)
+    businesses whose name or address contains q (case insensitive), best matches first:
+    names starting with q, then addresses starting with q, then by relevance
+    SQLite: FTS5 trigram MATCH, shorter names first (bm25 would score every match,
+            tens of ms when a query matches a tenth of the table), a LIKE scan before 3.34
+    PostgreSQL: ILIKE on the pg_trgm indexes ordered by similarity()
+    return the rows of the projected columns fields
+    EXAMPLE
+        serializer = serializer_for(Business, 'short')
+        businesses = serializer.to_dicts(search_businesses('bakery', serializer.fields, 20))
+'''
+def search_businesses(q, fields, limit):
+    dialect = db.engine.dialect.name
+    pattern = _like_escape(q)
+    # LIKE is already case insensitive on SQLite, lower() on every match would double the cost
+    like = 'like' if dialect == 'sqlite' else 'ilike'
+    prefix_first = case([
+        (getattr(Business.name, like)(pattern + '%', escape='\\'), 0),
+        (getattr(Business.address, like)(pattern + '%', escape='\\'), 1)
+    ], else_=2)
+    query = projected_query(Business, fields)
+
+    if dialect == 'sqlite' and len(q) >= TRIGRAM_MIN_LENGTH and _has_fts(db.engine):
+        # a quoted FTS5 string is a phrase, with the trigram tokenizer that is a substring match
+        phrase = '"{}"'.format(q.replace('"', '""'))
+        matches = select([_businesses_fts.c.rowid]) \
+            .where(literal_column('businesses_fts').op('MATCH')(phrase))
+        query = query.filter(Business.id.in_(matches)) \
+            .order_by(prefix_first, func.length(Business.name), Business.id)
+    else:
+        query = query.filter(or_(
+            getattr(Business.name, like)('%' + pattern + '%', escape='\\'),
+            getattr(Business.address, like)('%' + pattern + '%', escape='\\')))
+        if dialect == 'postgresql':
+            relevance = func.greatest(func.similarity(Business.name, q), func.similarity(Business.address, q))
+            query = query.order_by(prefix_first, relevance.desc(), Business.id)
+        else:
+            query = query.order_by(prefix_first, Business.id)
+
+    return query.limit(limit).all()
+
+
+def _has_fts(engine):
+    # looked up once per engine, the schema does not change under a running process
+    if engine not in _fts_engines:
+        _fts_engines[engine] = 'businesses_fts' in inspect(engine).get_table_names()
+    return _fts_engines[engine]
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+## Nearby
+
+'''
+near_args()
+    reads lat, lon, radius (km) and limit from the query string of the current request
+    aborts with 400 when the point is missing or invalid or the radius is out of range
+'''
+def near_args():
+    try:
+        latitude = float(request.args['lat'])
+        longitude = float(request.args['lon'])
+        radius = float(request.args.get('radius', NEAR_RADIUS_DEFAULT_KM))
+        limit = int(request.args.get('limit', PAGE_SIZE_DEFAULT))
+    except (KeyError, ValueError):
+        abort(400)
+    if not valid_coordinates(latitude, longitude) or not 0 < radius <= NEAR_RADIUS_MAX_KM or limit < 1:
+        abort(400)
+    return latitude, longitude, radius, min(limit, PAGE_SIZE_MAX)
+
+
+'''
+near_businesses(latitude, longitude, radius_km, fields, limit)
+    the businesses within radius_km of the point, nearest first
+    the search starts with a small circle and widens it (x4) until it holds limit
+    businesses or reaches radius_km, so dense areas only read the blocks next to the point
+    return a list of (distance_km, row) where row has the projected columns fields
+    EXAMPLE
+        fields = serializer_for(Business, 'short').fields
+        for distance, row in near_businesses(40.4168, -3.7038, 2, fields, 20):
+            ...
+'''
+def near_businesses(latitude, longitude, radius_km, fields, limit):
+    search_radius = min(radius_km, NEAR_START_RADIUS_KM)
+    while True:
+        # everything within search_radius was read, the limit nearest ones are final
+        found = _businesses_within(latitude, longitude, search_radius, fields, limit)
+        if len(found) >= limit or search_radius >= radius_km:
+            return found
+        search_radius = min(radius_km, search_radius * 4)
+
+
+'''
+_businesses_within(latitude, longitude, radius_km, fields, limit)
+    candidates are read from the geohash index: one range scan per cell of the
+    3 x 3 block of cells around the point, each cell at least radius_km wide,
+    trimmed by the bounding box of the circle; the exact distance ranks them
+'''
+def _businesses_within(latitude, longitude, radius_km, fields, limit):
+    query = projected_query(Business, tuple(fields) + ('latitude', 'longitude'))
+
+    precision = search_precision(latitude, radius_km)
+    if precision > 0:
+        ranges = []
+        for low, high in map(prefix_range, covering_cells(latitude, longitude, precision)):
+            ranges.append(Business.geohash >= low if high is None else
+                          and_(Business.geohash >= low, Business.geohash < high))
+        query = query.filter(or_(*ranges))
+    else:
+        query = query.filter(Business.geohash.isnot(None))
+
+    lat_degrees, lon_degrees = box_size(latitude, radius_km)
+    query = query.filter(Business.latitude.between(latitude - lat_degrees, latitude + lat_degrees))
+    # the box is only usable when it does not cross the antimeridian
+    if lon_degrees is not None and -180 <= longitude - lon_degrees and longitude + lon_degrees <= 180:
+        query = query.filter(Business.longitude.between(longitude - lon_degrees, longitude + lon_degrees))
+
+    width = len(fields)
+    candidates = ((haversine_km(latitude, longitude, row[width], row[width + 1]), row[:width])
+                  for row in query)
+    return heapq.nsmallest(limit, (candidate for candidate in candidates if candidate[0] <= radius_km),
+                           key=lambda candidate: candidate[0])
@@ -0,0 +1,200 @@
+import csv
+import io
+import multiprocessing
+import os
+import random
+import time
+
+from models import db, Business, Customer, Product
+
+# rows generated per task, part of the seed: the data of a chunk does not depend
+# on the number of processes
+SEED_CHUNK_SIZE = 10000
+
+# rows per table of the named dataset sizes, products point to random businesses
+SEED_PROFILES = {
+    'small': {'businesses': 10000, 'customers': 100000, 'products': 50000},
+    'medium': {'businesses': 100000, 'customers': 1000000, 'products': 500000},
+    'large': {'businesses': 1000000, 'customers': 10000000, 'products': 5000000}
+}
+
+# businesses first, products reference them
+SEED_MODELS = (Business, Customer, Product)
+
+_ADJECTIVES = ('Green', 'Golden', 'Little', 'Old', 'Blue', 'Corner', 'Happy', 'Fresh', 'Royal', 'Urban',
+               'Rustic', 'Sunny', 'Silver', 'Local', 'Family')
+_NOUNS = ('Bakery', 'Books', 'Grocery', 'Cafe', 'Florist', 'Butcher', 'Hardware', 'Tailor', 'Deli',
+          'Pharmacy', 'Bistro', 'Market', 'Studio', 'Garage', 'Toys')
+_FIRST_NAMES = ('Ana', 'Luis', 'Marta', 'Jorge', 'Lucia', 'Pablo', 'Elena', 'Carlos', 'Sara', 'Diego',
+                'Laura', 'Hugo', 'Irene', 'Mario', 'Noa')
+_LAST_NAMES = ('Garcia', 'Lopez', 'Martin', 'Sanchez', 'Perez', 'Gomez', 'Ruiz', 'Diaz', 'Moreno', 'Alvarez',
+               'Romero', 'Navarro', 'Torres', 'Gil', 'Vidal')
+_STREETS = ('Calle Mayor', 'Gran Via', 'Calle del Sol', 'Avenida de America', 'Calle Real', 'Paseo del Prado',
+            'Calle Nueva', 'Ronda Norte', 'Plaza Espana', 'Calle Luna')
+_PRODUCTS = ('Bread', 'Coffee', 'Novel', 'Apples', 'Roses', 'Hammer', 'Cheese', 'Tea', 'Candle', 'Wine',
+             'Soap', 'Notebook', 'Honey', 'Olive Oil', 'Puzzle')
+# (city, latitude, longitude) the businesses are spread around
+_CITIES = (('Madrid', 40.4168, -3.7038), ('Barcelona', 41.3874, 2.1686), ('Valencia', 39.4699, -0.3763),
+           ('Sevilla', 37.3891, -5.9845), ('Bilbao', 43.2630, -2.9350))
+
+
+## Rows
+
+'''
+business_row(i, rng), customer_row(i, rng), product_row(i, rng, businesses)
+    row i of a table, the columns that must be unique embed i
+    ids are i + 1 so the products can reference the businesses before they are read back
+'''
+def business_row(i, rng):
+    city, latitude, longitude = rng.choice(_CITIES)
+    return {
+        'id': i + 1,
+        'name': '{} {} {}'.format(rng.choice(_ADJECTIVES), rng.choice(_NOUNS), i),
+        'email': 'business{}@example.com'.format(i),
+        'address': '{} {}, {}'.format(rng.choice(_STREETS), rng.randint(1, 200), city),
+        'cif': 'B{:09d}'.format(i),
+        'phone': '+34 8{:09d}'.format(i),
+        # a few kilometres around the centre of the city
+        'latitude': round(rng.gauss(latitude, 0.03), 6),
+        'longitude': round(rng.gauss(longitude, 0.04), 6)
+    }
+
+
+def customer_row(i, rng):
+    return {
+        'id': i + 1,
+        'name': '{} {} {}'.format(rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES), i),
+        'email': 'customer{}@example.com'.format(i),
+        'address': '{} {}, {}'.format(rng.choice(_STREETS), rng.randint(1, 200), rng.choice(_CITIES)[0]),
+        'phone': '+34 6{:09d}'.format(i)
+    }
+
+
+def product_row(i, rng, businesses):
+    return {
+        'id': i + 1,
+        'name': '{} {}'.format(rng.choice(_PRODUCTS), i),
+        'price': round(rng.uniform(0.5, 200), 2),
+        'available': rng.random() < 0.8,
+        'business_id': rng.randint(1, businesses)
+    }
+
+
+_ROW_MAKERS = {'businesses': business_row, 'customers': customer_row, 'products': product_row}
+
+
+def _columns(model):
+    return [column.name for column in model.__table__.columns]
+
+
+'''
+generate_chunk(task)
+    the rows [start, stop) of a table as tuples in column order (or as CSV text for COPY)
+    task is (table, seed, chunk, start, stop, businesses, as_csv), every chunk has its own
+    generator seeded from (seed, table, chunk), it runs in the worker processes
+'''
+def generate_chunk(task):
+    table, seed, chunk, start, stop, businesses, as_csv = task
+    model = next(model for model in SEED_MODELS if model.__tablename__ == table)
+    columns = model.__table__.columns
+    derived = [(column.name, column.info['derive']) for column in columns if 'derive' in column.info]
+    # columns the rows leave out take their scalar default (the version starts at 1)
+    defaults = [(column.name, column.default.arg) for column in columns
+                if column.default is not None and column.default.is_scalar]
+    make_row = _ROW_MAKERS[table]
+    rng = random.Random('{}:{}:{}'.format(seed, table, chunk))
+
+    rows = []
+    for i in range(start, stop):
+        values = make_row(i, rng, businesses) if table == 'products' else make_row(i, rng)
+        for name, derive in derived:
+            values[name] = derive(values)
+        for name, default in defaults:
+            values.setdefault(name, default)
+        rows.append(tuple(values.get(column.name) for column in columns))
+    if not as_csv:
+        return rows
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+## Seed
+
+'''
+seed_database(counts, seed, processes, progress)
+    fills the empty businesses, customers and products tables with counts[table] rows
+    generated from seed: the same seed and counts always give the same data
+    chunks are generated by processes worker processes while the main one writes
+    PostgreSQL: COPY FROM STDIN, other databases: executemany on the raw connection
+    progress(table, stats) is called after every chunk
+    return the stats per table: rows, seconds, rows_per_second
+    EXAMPLE
+        seed_database(SEED_PROFILES['small'], seed=42)
+'''
+def seed_database(counts, seed=0, processes=None, progress=None):
+    for model in SEED_MODELS:
+        if db.session.query(model.id).first() is not None:
+            raise ValueError('the {} table is not empty'.format(model.__tablename__))
+    db.session.remove()
+
+    postgres = db.engine.dialect.name == 'postgresql'
+    marker = '?' if db.engine.dialect.paramstyle == 'qmark' else '%s'
+    processes = processes or os.cpu_count() or 1
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    connection = db.engine.raw_connection()
+    results = {}
+    try:
+        for model in SEED_MODELS:
+            table = model.__tablename__
+            count = counts.get(table, 0)
+            tasks = [(table, seed, chunk, start, min(start + SEED_CHUNK_SIZE, count),
+                      counts.get('businesses', 0), postgres)
+                     for chunk, start in enumerate(range(0, count, SEED_CHUNK_SIZE))]
+            if table == 'products' and count and not counts.get('businesses'):
+                raise ValueError('products need businesses to belong to')
+
+            stats = {'rows': 0}
+            start = time.perf_counter()
+            chunks = pool.imap(generate_chunk, tasks) if pool is not None else map(generate_chunk, tasks)
+            for rows in chunks:
+                stats['rows'] += _write_chunk(connection, model, rows, postgres, marker)
+                _add_rate(stats, start)
+                if progress is not None:
+                    progress(table, stats)
+            _add_rate(stats, start)
+            results[table] = stats
+
+        cursor = connection.cursor()
+        for model in SEED_MODELS:
+            if postgres:
+                # the ids were given, the sequences must continue after them
+                cursor.execute("SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                               "COALESCE(MAX(id), 0) + 1, false) FROM {0}".format(model.__tablename__))
+            cursor.execute('ANALYZE {}'.format(model.__tablename__))
+        connection.commit()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        connection.close()
+    return results
+
+
+def _write_chunk(connection, model, rows, postgres, marker):
+    columns = _columns(model)
+    cursor = connection.cursor()
+    if postgres:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            model.__tablename__, ', '.join(columns)), io.StringIO(rows))
+        count = cursor.rowcount
+    else:
+        cursor.executemany('INSERT INTO {} ({}) VALUES ({})'.format(
+            model.__tablename__, ', '.join(columns), ', '.join([marker] * len(columns))), rows)
+        count = len(rows)
+    connection.commit()
+    return count
+
+
+def _add_rate(stats, start):
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Response
+from werkzeug.http import http_date
+
+from metrics import timed_phase
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# auto (orjson when installed), orjson or json (standard library)
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+
+def _default(value):
+    # the types jsonify encoded as well: dates as HTTP dates like flask.json.JSONEncoder,
+    # Decimal (Numeric columns on PostgreSQL) as a number
+    if isinstance(value, datetime):
+        return http_date(value.utctimetuple())
+    if isinstance(value, date):
+        return http_date(value.timetuple())
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+# built once, encode() goes straight to the C accelerated encoder
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+def _stdlib_dumps(obj):
+    return _encoder.encode(obj).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    # dates go through _default too, both backends give the same bytes
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+'''
+dumps(obj)
+    encodes obj as compact JSON bytes with the fastest available backend
+'''
+if orjson is not None and JSON_BACKEND in ('auto', 'orjson'):
+    dumps = _orjson_dumps
+    json_backend = 'orjson'
+else:
+    dumps = _stdlib_dumps
+    json_backend = 'json'
+# the serialize phase of the request metrics
+dumps = timed_phase('serialize')(dumps)
+
+
+'''
+ModelSerializer
+    serializer of one model view (the columns of short() or long()), built once per view
+    it turns projected row tuples into dicts of a fixed shape without going through the
+    model, the whole response is then encoded by dumps in a single call
+    EXAMPLE
+        serializer = serializer_for(Business, 'short')
+        businesses = serializer.to_dicts(projected_query(Business, serializer.fields).all())
+'''
+class ModelSerializer:
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+    def to_dict(self, row):
+        return dict(zip(self.fields, row))
+
+    def to_dicts(self, rows):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+    def dumps_row(self, row):
+        return dumps(dict(zip(self.fields, row)))
+
+
+_serializers = {}
+
+
+'''
+serializer_for(model, view)
+    returns the serializer of the 'short' or 'long' view of a model, built once per process
+'''
+def serializer_for(model, view):
+    key = (model, view)
+    serializer = _serializers.get(key)
+    if serializer is None:
+        fields = model.SHORT_FIELDS if view == 'short' else model.LONG_FIELDS
+        serializer = _serializers[key] = ModelSerializer(fields)
+    return serializer
+
+
+'''
+json_response(body)
+    drop-in replacement of jsonify encoding body with dumps
+'''
+def json_response(body, status=200):
+    return Response(dumps(body), status=status, mimetype='application/json')
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import weakref
+from collections import deque
+from datetime import datetime, timezone
+from flask import has_request_context, request
+import sqltiming
+
+# statements slower than this many milliseconds are recorded, unset turns the recorder off
+SLOW_QUERY_THRESHOLD_MS = os.environ.get('SLOW_QUERY_THRESHOLD_MS')
+SLOW_QUERY_THRESHOLD_MS = float(SLOW_QUERY_THRESHOLD_MS) if SLOW_QUERY_THRESHOLD_MS else None
+# slow statements kept in memory, the oldest ones are dropped first
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 100))
+# run EXPLAIN ANALYZE (PostgreSQL) instead of EXPLAIN: real row counts and timings,
+# but the slow SELECT runs a second time
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', 'false').lower() in ('1', 'true', 'yes')
+
+logger = logging.getLogger(__name__)
+
+# parameters of these types are kept as they are, the others are redacted
+_SAFE_PARAMETER_TYPES = (bool, int, float, type(None))
+
+
+'''
+SlowQueryLog
+    records the statements of the instrumented engines that run longer than
+    threshold_ms, with the route that issued them, their redacted parameters
+    and their query plan, in a ring buffer of the last size entries
+    EXAMPLE
+        slow_query_log.install(db.engine)
+        for entry in slow_query_log.entries():
+            print(entry['duration_ms'], entry['route'], entry['statement'])
+'''
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, size=SLOW_QUERY_LOG_SIZE,
+                 explain_analyze=SLOW_QUERY_EXPLAIN_ANALYZE):
+        self.threshold_ms = threshold_ms
+        self.explain_analyze = explain_analyze
+        self._entries = deque(maxlen=size)
+        self._engines = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold_ms is not None
+
+    '''
+    install(engine)
+        listens to the statements of the engine, once per engine
+    '''
+    def install(self, engine):
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+        sqltiming.listen(engine, self._record)
+
+    def entries(self):
+        with self._lock:
+            # newest first
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _record(self, conn, statement, parameters, executemany, seconds):
+        duration_ms = seconds * 1000
+        if self.threshold_ms is None or duration_ms < self.threshold_ms:
+            return
+
+        route = method = None
+        if has_request_context():
+            route = request.url_rule.rule if request.url_rule is not None else request.path
+            method = request.method
+        # an executemany has one set of parameters per row, its plan is the one of a single row
+        explain, plan = (None, None) if executemany else self._explain(conn, statement, parameters)
+        entry = {
+            'at': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration_ms, 3),
+            'route': route,
+            'method': method,
+            'statement': statement,
+            'parameters': redact(parameters),
+            'explain': explain,
+            'plan': plan
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning('slow query %.1f ms on %s %s: %s', duration_ms, method, route, statement)
+
+    '''
+    _explain(conn, statement, parameters)
+        (explain command, plan lines) of the statement, run on the same connection
+        through a cursor of its own so the result of the slow statement is untouched
+    '''
+    def _explain(self, conn, statement, parameters):
+        dialect = conn.dialect.name
+        if dialect == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN'
+        elif dialect == 'postgresql':
+            # ANALYZE executes the statement: only for reads
+            analyze = self.explain_analyze and statement.lstrip()[:6].upper() in ('SELECT', 'WITH')
+            explain = 'EXPLAIN (ANALYZE, BUFFERS)' if analyze else 'EXPLAIN'
+        else:
+            return None, None
+
+        cursor = conn.connection.cursor()
+        try:
+            if dialect == 'postgresql':
+                # a failed EXPLAIN must not abort the transaction of the request
+                cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute('{} {}'.format(explain, statement), parameters)
+                rows = cursor.fetchall()
+            except Exception as error:
+                if dialect == 'postgresql':
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                return explain, ['EXPLAIN failed: {}'.format(error)]
+            finally:
+                if dialect == 'postgresql':
+                    cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        finally:
+            cursor.close()
+
+        # SQLite: (id, parent, notused, detail), PostgreSQL: one line of the plan per row
+        return explain, [row[-1] for row in rows]
+
+
+'''
+redact(parameters)
+    the parameters of a statement with every value that could hold personal data
+    (strings, bytes, dates...) replaced by its type and length, numbers are kept
+    EXAMPLE
+        redact(('ana@example.com', 20)) == ['<str 15>', 20]
+'''
+def redact(parameters):
+    if isinstance(parameters, dict):
+        return dict((key, _redact_value(value)) for key, value in parameters.items())
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) if isinstance(value, (dict, list, tuple)) else _redact_value(value)
+                for value in parameters]
+    return _redact_value(parameters)
+
+
+def _redact_value(value):
+    if isinstance(value, _SAFE_PARAMETER_TYPES):
+        return value
+    try:
+        return '<{} {}>'.format(type(value).__name__, len(value))
+    except TypeError:
+        return '<{}>'.format(type(value).__name__)
+
+
+slow_query_log = SlowQueryLog()
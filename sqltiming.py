@@ -0,0 +1,38 @@
+import time
+from sqlalchemy import event
+
+
+'''
+listen(target, on_statement)
+    calls on_statement(conn, statement, parameters, executemany, seconds) after every
+    SQL statement run by target (an engine, or the Engine class for all of them)
+    the request metrics and the slow query log time the statements through it
+    EXAMPLE
+        listen(db.engine, lambda conn, statement, parameters, executemany, seconds: print(seconds))
+'''
+def listen(target, on_statement):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        on_statement(conn, statement, parameters, executemany, elapsed(conn, context))
+
+    if not event.contains(target, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(target, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(target, 'after_cursor_execute', after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # on the execution context: a statement that raises never reaches after_cursor_execute,
+    # its start time goes away with the context instead of piling up on the pooled connection
+    # (the few statements run without a context overwrite a single slot)
+    if context is not None:
+        context._sql_timing_start = time.perf_counter()
+    else:
+        conn.info['sql_timing_start'] = time.perf_counter()
+
+
+'''
+elapsed(conn, context)
+    seconds since the current statement of conn started
+'''
+def elapsed(conn, context):
+    start = context._sql_timing_start if context is not None else conn.info['sql_timing_start']
+    return time.perf_counter() - start
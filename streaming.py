@@ -0,0 +1,44 @@
+import os
+from flask import request, Response, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# rows fetched from the database cursor (and lines written) per round
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+
+
+'''
+wants_stream()
+    True when the client asked for the whole listing as NDJSON,
+    either with ?stream=1 or with Accept: application/x-ndjson
+'''
+def wants_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+'''
+stream_ndjson(query, dumps_row)
+    streams every row of the query as one JSON document per line,
+    dumps_row encodes a row to JSON bytes
+    rows are read batch_size at a time through a server-side cursor, so the
+    memory of the worker stays flat whatever the size of the table
+    EXAMPLE
+        serializer = serializer_for(Business, 'short')
+        query = projected_query(Business, serializer.fields).order_by(Business.id)
+        return stream_ndjson(query, serializer.dumps_row)
+'''
+def stream_ndjson(query, dumps_row, batch_size=STREAM_BATCH_SIZE):
+    def generate():
+        rows = query.execution_options(stream_results=True).yield_per(batch_size)
+        lines = []
+        for row in rows:
+            lines.append(dumps_row(row))
+            if len(lines) == batch_size:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -4,12 +4,37 @@ import json
 from flask_sqlalchemy import SQLAlchemy
 
 from app import create_app
-from models import setup_db
+from models import db, setup_db
+from cache import listing_cache
+from pagination import encode_cursor
+import auth
+import metrics
+from slowlog import slow_query_log
+import wsgi
+
+BUSINESS_PERMISSIONS = ['delete:business', 'get:business-detail', 'get:businesses',
+                        'get:customers', 'post:business']
+CUSTOMER_PERMISSIONS = ['delete:customer', 'get:businesses', 'get:customer-detail',
+                        'get:customers', 'post:customer']
 
 
 class IBuyLocalTestCase(unittest.TestCase):
     """This class represents the i buy local test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        # sign our own tokens with an in-process keypair, the Auth0 tokens of the environment
+        # (setup.sh exports long expired ones) are only used when TEST_AUTH0_TOKENS=1 asks for them
+        cls.key_provider = None
+        if os.environ.get('TEST_AUTH0_TOKENS') != '1':
+            cls.key_provider = auth.RSAKeypairProvider(key_size=1024)
+            auth.configure_key_provider(cls.key_provider)
+
+        # create all tables, once for the test case and whatever the DB_SCHEMA_MODE
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+
     def setUp(self):
         """Define test variables and initialize app."""
         self.app = create_app()
@@ -17,21 +42,16 @@ class IBuyLocalTestCase(unittest.TestCase):
         #self.database_name = "i_buy_local"
         #self.database_path = "postgres://{}:{}@{}/{}".format('postgres','EresTonto','localhost:5432', self.database_name)
         #setup_db(self.app, self.database_path)
-        setup_db(self.app)
 
         self.BUSINESS_TOKEN = os.environ.get('BUSINESS_TOKEN')
         self.CUSTOMER_TOKEN = os.environ.get('CUSTOMER_TOKEN')
+        if self.key_provider is not None:
+            self.BUSINESS_TOKEN = self.key_provider.mint_token(BUSINESS_PERMISSIONS)
+            self.CUSTOMER_TOKEN = self.key_provider.mint_token(CUSTOMER_PERMISSIONS)
         
 
         unittest.TestLoader.sortTestMethodsUsing = None
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-
     def tearDown(self):
         """Executed after reach test"""
         pass
@@ -84,6 +104,115 @@ class IBuyLocalTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
 
     
+    # the health check reports the connection pool without a token
+    def test_health(self):
+        res = self.client().get('/health')
+
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('pool', data['database'])
+
+
+    # with the metrics installed every route should report its latency and SQL statements
+    def test_metrics(self):
+        metrics.install(self.app, enabled=True)
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        # buffered: the request is timed until the server closes the response
+        self.client().get('/businesses/1', headers=auth_header, buffered=True)
+        res = self.client().get('/metrics')
+
+        text = res.data.decode('utf-8')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('route="/businesses/<int:id>",method="GET",status="200"', text)
+        self.assertIn('db_statements_per_request_count{', text)
+        self.assertIn('cache_lookups_total{', text)
+        # the token check is timed even when metrics.py was imported with the metrics off
+        auth_sum = [line for line in text.splitlines() if line.startswith('http_request_phase_seconds_sum{')
+                    and 'route="/businesses/<int:id>",phase="auth"' in line]
+        self.assertGreater(float(auth_sum[0].rsplit(' ', 1)[1]), 0)
+
+
+    # with the recorder on the slow statements of a route should be listed with their plan
+    def test_get_slow_queries(self):
+        if self.key_provider is None:
+            self.skipTest('needs the in-process keypair to sign an admin token')
+        auth_header = { 'Authorization': "Bearer {}".format(
+            self.key_provider.mint_token(CUSTOMER_PERMISSIONS + ['get:slow-queries'])) }
+        with self.app.app_context():
+            slow_query_log.install(db.engine)
+        slow_query_log.threshold_ms = 0
+        try:
+            self.client().get('/customers?limit=3', headers=auth_header)
+            res = self.client().get('/admin/slow-queries', headers=auth_header)
+        finally:
+            slow_query_log.threshold_ms = None
+            slow_query_log.clear()
+
+        data = json.loads(res.data)
+        routes = [query['route'] for query in data['queries']]
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('/customers', routes)
+        self.assertTrue(all(query['plan'] for query in data['queries']))
+
+
+    # the slow queries should only be shown to the holders of the permission
+    def test_get_slow_queries_without_permission(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().get('/admin/slow-queries', headers=auth_header)
+
+        self.assertEqual(res.status_code, 403)
+
+
+    # the metrics endpoint should not exist while the metrics are disabled
+    def test_metrics_disabled(self):
+        res = self.client().get('/metrics')
+
+        self.assertEqual(res.status_code, 404)
+
+
+    # warming up should build the first page of the listings before any request
+    def test_warm_up_fills_listing_cache(self):
+        listing_cache.clear()
+        wsgi.warm_up(self.app)
+
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        hits = listing_cache.stats['hits']
+        res = self.client().get('/businesses', headers=auth_header)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(listing_cache.stats['hits'], hits + 1)
+
+
+    # posting businesses in bulk should create the valid rows and report the others
+    def test_post_businesses_bulk(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        rows = [{'name': 'bulk{}'.format(i), 'address': 'address', 'phone': 'bulk_phone{}'.format(i),
+                 'cif': 'bulk_cif{}'.format(i), 'email': 'bulk{}@bulk.com'.format(i)} for i in range(3)]
+        rows.append(dict(rows[0], name='bulk_duplicate'))
+        rows.append({'name': 'bulk_incomplete'})
+        res = self.client().post('/businesses/bulk', headers=auth_header, json=rows)
+
+        data = json.loads(res.data)
+        for result in data['results']:
+            if result['success']:
+                self.client().delete('/businesses/{}'.format(result['id']), headers=auth_header)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created'], 3)
+        self.assertEqual(data['results'][3]['error'], 'duplicate email')
+        self.assertEqual(data['results'][4]['error'], 'missing email')
+
+
+    # posting businesses in bulk using customer role should return 403 forbidden
+    def test_post_businesses_bulk_using_customer_token(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.CUSTOMER_TOKEN) }
+        res = self.client().post('/businesses/bulk', headers=auth_header, json=[])
+
+        self.assertEqual(res.status_code, 403)
+
+
     # patching a business using a business role should edit the business and return 200
     def test_patching_business_using_business_token(self):
         auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
@@ -109,6 +238,61 @@ class IBuyLocalTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
 
 
+    # patching with the current version in If-Match should bump the version, a stale one should return 412
+    def test_patching_business_with_if_match(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        created = self.client().post('/businesses', headers=auth_header, json={'name': 'versioned',
+         'address': 'Old road 1', 'phone': 'versioned_phone', 'cif': 'versioned_cif',
+         'email': 'versioned@business.com'})
+        business = json.loads(created.data)['business']
+
+        patched = self.client().patch('/businesses', headers=dict(auth_header, **{'If-Match': '"{}"'.format(
+            business['version'])}), json={'id': business['id'], 'address': 'New road 2'})
+        stale = self.client().patch('/businesses', headers=dict(auth_header, **{'If-Match': '"{}"'.format(
+            business['version'])}), json={'id': business['id'], 'address': 'Lost road 3'})
+        stale_delete = self.client().delete('/businesses/{}'.format(business['id']),
+            headers=dict(auth_header, **{'If-Match': '"{}"'.format(business['version'])}))
+        current = self.client().get('/businesses/{}'.format(business['id']), headers=auth_header)
+        deleted = self.client().delete('/businesses/{}'.format(business['id']),
+            headers=dict(auth_header, **{'If-Match': patched.headers['ETag']}))
+
+        data = json.loads(patched.data)
+        self.assertEqual(patched.status_code, 200)
+        self.assertEqual(data['business']['version'], business['version'] + 1)
+        self.assertEqual(data['business']['name'], 'versioned')
+        self.assertEqual(patched.headers['ETag'], '"{}"'.format(business['version'] + 1))
+        self.assertEqual(stale.status_code, 412)
+        self.assertEqual(stale_delete.status_code, 412)
+        self.assertEqual(json.loads(current.data)['customer']['address'], 'New road 2')
+        self.assertEqual(deleted.status_code, 200)
+
+
+    # weak or unquoted tags in If-Match should never match the version of the row
+    def test_patching_business_with_weak_if_match(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        created = self.client().post('/businesses', headers=auth_header, json={'name': 'weak',
+         'address': 'Old road 1', 'phone': 'weak_phone', 'cif': 'weak_cif', 'email': 'weak@business.com'})
+        business = json.loads(created.data)['business']
+
+        responses = []
+        for header in ('W/"{0}", "{1}"', 'W/"{0}"', '{0}'):
+            responses.append(self.client().patch('/businesses', headers=dict(auth_header, **{
+                'If-Match': header.format(business['version'], business['version'] + 6)}),
+                json={'id': business['id'], 'address': 'New road 2'}))
+        self.client().delete('/businesses/{}'.format(business['id']), headers=auth_header)
+
+        self.assertEqual([res.status_code for res in responses], [412, 412, 412])
+
+
+    # patching a business that does not exist should return 422
+    def test_patching_missing_business(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().patch('/businesses', headers=dict(auth_header, **{'If-Match': '"1"'}),
+                                  json={'id': 999999, 'address': 'Nowhere'})
+
+        self.assertEqual(res.status_code, 422)
+
+
     # deleting a business using business role should return 200
     def test_delete_business_using_business_token(self):
         auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
@@ -154,6 +338,268 @@ class IBuyLocalTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
 
 
+    # Get a page of businesses return the page and a cursor to the next one
+    def test_get_businesses_paginated(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        ids = []
+        for i in range(3):
+            res = self.client().post('/businesses', headers=auth_header, json={
+             'name': 'paged{}'.format(i), 'address': 'address', 'phone':'paged_phone{}'.format(i),
+             'cif':'paged_cif{}'.format(i), 'email':'paged{}@paged.com'.format(i)})
+            ids.append(json.loads(res.data)['business']['id'])
+
+        res = self.client().get('/businesses?limit=2', headers=auth_header)
+        first_page = json.loads(res.data)
+        res = self.client().get('/businesses?limit=2&after={}'.format(first_page['next']), headers=auth_header)
+        second_page = json.loads(res.data)
+
+        for id in ids:
+            self.client().delete('/businesses/{}'.format(id), headers=auth_header)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(first_page['businesses']), 2)
+        self.assertGreater(second_page['businesses'][0]['id'], first_page['businesses'][-1]['id'])
+
+
+    # Get a list of businesses or customers with a hand-made cursor out of range return 400 error status
+    def test_get_list_forged_cursor(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        for last_id in (True, 10 ** 30, -1):
+            for resource in ('businesses', 'customers'):
+                res = self.client().get('/{}?after={}'.format(resource, encode_cursor(last_id)), headers=auth_header)
+
+                self.assertEqual(res.status_code, 400)
+                self.assertEqual(json.loads(res.data)['success'], False)
+
+
+    # Get a list of businesses with a limit that is not a number return 400 error status
+    def test_get_businesses_bad_limit(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().get('/businesses?limit=abc', headers=auth_header)
+
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+
+    # Get a list of businesses with a malformed cursor return 400 error status
+    def test_get_businesses_bad_cursor(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().get('/businesses?after=notacursor', headers=auth_header)
+
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+
+    # Streaming the businesses return one JSON document per line
+    def test_stream_businesses(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN),
+                        'Accept': 'application/x-ndjson' }
+        res = self.client().get('/businesses', headers=auth_header)
+
+        rows = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(all('name' in row for row in rows))
+
+
+    # Get businesses with the ETag of the current listing return 304 until a business changes
+    def test_get_businesses_conditional(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().get('/businesses', headers=auth_header)
+        etag = res.headers['ETag']
+
+        conditional_header = dict(auth_header, **{'If-None-Match': etag})
+        not_modified = self.client().get('/businesses', headers=conditional_header)
+
+        res = self.client().post('/businesses', headers=auth_header, json={
+         'name': 'etag', 'address': 'address', 'phone':'etag_phone', 'cif':'etag_cif',
+         'email':'etag@etag.com'})
+        modified = self.client().get('/businesses', headers=conditional_header)
+        self.client().delete('/businesses/{}'.format(json.loads(res.data)['business']['id']), headers=auth_header)
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(modified.status_code, 200)
+
+
+    # Searching businesses finds them by part of the name or the address, kept in sync by the writes
+    def test_search_businesses(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().post('/businesses', headers=auth_header, json={
+         'name': 'Zebrabakery', 'address': 'Quokka lane 5', 'phone':'search_phone', 'cif':'search_cif',
+         'email':'search@search.com'})
+        id = json.loads(res.data)['business']['id']
+
+        by_name = self.client().get('/businesses/search?q=RABAK', headers=auth_header)
+        short = self.client().get('/businesses/search?q=Ze', headers=auth_header)
+        self.client().patch('/businesses', headers=auth_header, json={'id': id, 'address': 'Wombat road 7'})
+        old_address = self.client().get('/businesses/search?q=quokka', headers=auth_header)
+        new_address = self.client().get('/businesses/search?q=wombat', headers=auth_header)
+        self.client().delete('/businesses/{}'.format(id), headers=auth_header)
+        deleted = self.client().get('/businesses/search?q=rabak', headers=auth_header)
+
+        def ids(res):
+            return [business['id'] for business in json.loads(res.data)['businesses']]
+
+        self.assertEqual(by_name.status_code, 200)
+        self.assertEqual(ids(by_name), [id])
+        self.assertIn(id, ids(short))
+        self.assertEqual(ids(old_address), [])
+        self.assertEqual(ids(new_address), [id])
+        self.assertEqual(ids(deleted), [])
+
+
+    # Searching businesses without a search text return 400 error status
+    def test_search_businesses_without_text(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().get('/businesses/search?q=', headers=auth_header)
+
+        self.assertEqual(res.status_code, 400)
+
+
+    # Get businesses near a point return the ones within the radius, nearest first
+    def test_get_businesses_near(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        # Puerta del Sol, Retiro (about 1.7 km) and Toledo (about 67 km)
+        points = [(40.4169, -3.7035), (40.4153, -3.6845), (39.8628, -4.0273)]
+        ids = []
+        for i, (latitude, longitude) in enumerate(points):
+            res = self.client().post('/businesses', headers=auth_header, json={
+             'name': 'near{}'.format(i), 'address': 'address', 'phone':'near_phone{}'.format(i),
+             'cif':'near_cif{}'.format(i), 'email':'near{}@near.com'.format(i),
+             'latitude': latitude, 'longitude': longitude})
+            ids.append(json.loads(res.data)['business']['id'])
+
+        res = self.client().get('/businesses/near?lat=40.4168&lon=-3.7038&radius=5', headers=auth_header)
+        moved = self.client().patch('/businesses', headers=auth_header, json={
+         'id': ids[2], 'latitude': 40.4168, 'longitude': -3.7038})
+        after_move = self.client().get('/businesses/near?lat=40.4168&lon=-3.7038&radius=5&limit=1',
+                                       headers=auth_header)
+        for id in ids:
+            self.client().delete('/businesses/{}'.format(id), headers=auth_header)
+
+        businesses = json.loads(res.data)['businesses']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([business['id'] for business in businesses], ids[:2])
+        self.assertLess(businesses[0]['distance_km'], businesses[1]['distance_km'])
+        self.assertEqual(moved.status_code, 200)
+        self.assertEqual(json.loads(after_move.data)['businesses'][0]['id'], ids[2])
+
+
+    # Get businesses near an invalid point return 400 error status
+    def test_get_businesses_near_bad_point(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().get('/businesses/near?lat=91&lon=0', headers=auth_header)
+
+        self.assertEqual(res.status_code, 400)
+
+
+    # Get business details after a patch return the patched business, not the cached one
+    def test_get_business_detail_after_patch(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().post('/businesses', headers=auth_header, json={
+         'name': 'cached', 'address': 'address', 'phone':'cached_phone', 'cif':'cached_cif',
+         'email':'cached@cached.com'})
+        id = json.loads(res.data)['business']['id']
+
+        self.client().get('/businesses/{}'.format(id), headers=auth_header)
+        self.client().patch('/businesses', headers=auth_header, json={'id': id, 'address': 'patched'})
+        res = self.client().get('/businesses/{}'.format(id), headers=auth_header)
+        self.client().delete('/businesses/{}'.format(id), headers=auth_header)
+        deleted = self.client().get('/businesses/{}'.format(id), headers=auth_header)
+
+        data = json.loads(res.data)
+
+        self.assertEqual(data['customer']['address'], 'patched')
+        self.assertEqual(deleted.status_code, 404)
+
+
+    # posting, listing, patching and deleting products of a business using a business role
+    def test_product_catalog_using_business_token(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        ids = []
+        for i in range(3):
+            res = self.client().post('/products', headers=auth_header, json={
+             'name': 'catalog_product{}'.format(i), 'price': 1.5 + i, 'available': True, 'business_id': 1})
+            self.assertEqual(res.status_code, 200)
+            ids.append(json.loads(res.data)['product']['id'])
+
+        first = self.client().get('/businesses/1/products?limit=2', headers=auth_header)
+        first_data = json.loads(first.data)
+        second = self.client().get('/businesses/1/products?limit=2&after={}'.format(first_data['next']),
+                                   headers=auth_header)
+        listed = [product['id'] for product in first_data['products'] + json.loads(second.data)['products']]
+
+        patched = self.client().patch('/products/{}'.format(ids[0]), headers=auth_header, json={'price': 9.0})
+        detail = self.client().get('/products/{}'.format(ids[0]), headers=auth_header)
+        for id in ids:
+            self.client().delete('/products/{}'.format(id), headers=auth_header)
+        deleted = self.client().get('/products/{}'.format(ids[0]), headers=auth_header)
+
+        self.assertTrue(set(ids) <= set(listed))
+        self.assertEqual(patched.status_code, 200)
+        self.assertEqual(json.loads(detail.data)['product']['price'], 9.0)
+        self.assertEqual(deleted.status_code, 404)
+
+
+    # deleting a business should make the cached details of its products answer 404
+    def test_delete_business_invalidates_products(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        created = self.client().post('/businesses', headers=auth_header, json={'name': 'cascade',
+         'address': 'Old road 1', 'phone': 'cascade_phone', 'cif': 'cascade_cif', 'email': 'cascade@business.com'})
+        business_id = json.loads(created.data)['business']['id']
+        res = self.client().post('/products', headers=auth_header, json={
+         'name': 'cascade_product', 'price': 2.0, 'available': True, 'business_id': business_id})
+        product_id = json.loads(res.data)['product']['id']
+
+        cached = self.client().get('/products/{}'.format(product_id), headers=auth_header)
+        deleted = self.client().delete('/businesses/{}'.format(business_id), headers=auth_header)
+        after = self.client().get('/products/{}'.format(product_id), headers=auth_header)
+
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(deleted.status_code, 200)
+        self.assertEqual(after.status_code, 404)
+
+
+    # posting a product of a business that does not exist return 422
+    def test_post_product_unknown_business(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        res = self.client().post('/products', headers=auth_header, json={
+         'name': 'orphan_product', 'price': 1.0, 'business_id': 999999})
+
+        self.assertEqual(res.status_code, 422)
+
+
+    # posting a product using customer role should return 403 forbidden
+    def test_post_product_using_customer_token(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.CUSTOMER_TOKEN) }
+        res = self.client().post('/products', headers=auth_header, json={
+         'name': 'customer_product', 'price': 1.0, 'business_id': 1})
+
+        self.assertEqual(res.status_code, 403)
+
+
+    # Get businesses with their products embeds the catalog of every business of the page
+    def test_get_businesses_include_products(self):
+        auth_header = { 'Authorization': "Bearer {}".format(self.BUSINESS_TOKEN) }
+        before = self.client().get('/businesses?include=products', headers=auth_header)
+        res = self.client().post('/products', headers=auth_header, json={
+         'name': 'embedded_product', 'price': 2.0, 'business_id': 1})
+        id = json.loads(res.data)['product']['id']
+        after = self.client().get('/businesses?include=products', headers=auth_header)
+        self.client().delete('/products/{}'.format(id), headers=auth_header)
+
+        business = [business for business in json.loads(after.data)['businesses'] if business['id'] == 1][0]
+
+        self.assertEqual(before.status_code, 200)
+        self.assertIn(id, [product['id'] for product in business['products']])
+
+
     # Get list customers using valid customer token return a 200 status
     def test_200_get_customers_using_customer_token(self):
         auth_header = { 'Authorization': "Bearer {}".format(self.CUSTOMER_TOKEN) }
@@ -0,0 +1,209 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import rsa
+from jose import jwt
+from jose.utils import long_to_base64
+
+import auth
+
+PUBLIC_KEY, PRIVATE_KEY = rsa.newkeys(512)
+
+
+class FakeResponse:
+    def __init__(self, jwks, cache_control=None):
+        self.body = json.dumps(jwks).encode('utf-8')
+        self.headers = {}
+        if cache_control is not None:
+            self.headers['Cache-Control'] = cache_control
+
+    def read(self):
+        return self.body
+
+
+def jwks_with(*kids):
+    return {'keys': [{
+        'kty': 'RSA',
+        'kid': kid,
+        'use': 'sig',
+        'n': long_to_base64(PUBLIC_KEY.n).decode('ascii'),
+        'e': long_to_base64(PUBLIC_KEY.e).decode('ascii')
+    } for kid in kids]}
+
+
+def signed_token(kid, **claims):
+    claims.setdefault('iss', 'https://example.test/')
+    claims.setdefault('aud', 'i-buy-local')
+    claims.setdefault('exp', int(time.time()) + 60)
+    claims.setdefault('permissions', ['get:businesses'])
+    return jwt.encode(claims, PRIVATE_KEY.save_pkcs1().decode('ascii'),
+                      algorithm='RS256', headers={'kid': kid})
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    def setUp(self):
+        self.cache = auth.JWKSCache(auth.Auth0KeyProvider('example.test'),
+                                    ttl=600, min_refresh_interval=30)
+
+    # repeated lookups should only fetch the key set once
+    def test_jwks_is_fetched_once(self):
+        with mock.patch('auth.urlopen', return_value=FakeResponse(jwks_with('a'))) as urlopen:
+            for _ in range(5):
+                algorithm, key = self.cache.get_key('a')
+                self.assertEqual(algorithm, 'RS256')
+
+        self.assertEqual(urlopen.call_count, 1)
+        self.assertEqual(self.cache.stats, {'hits': 4, 'misses': 1, 'refreshes': 1})
+
+    # the max-age sent by the server should override the default ttl
+    def test_jwks_honours_cache_control(self):
+        response = FakeResponse(jwks_with('a'), cache_control='public, max-age=0')
+        with mock.patch('auth.urlopen', return_value=response):
+            self.cache.min_refresh_interval = 0
+            self.cache.background_refresh = False
+            self.cache.get()
+            self.cache.get()
+
+        self.assertEqual(self.cache.stats['refreshes'], 2)
+
+    # an expired key set should keep serving while it is refreshed in the background
+    def test_expired_jwks_is_refreshed_in_background(self):
+        responses = [FakeResponse(jwks_with('a'), cache_control='max-age=0'), FakeResponse(jwks_with('a', 'b'))]
+        with mock.patch('auth.urlopen', side_effect=responses):
+            self.cache.min_refresh_interval = 0
+            self.cache.get()
+            stale = self.cache.get()
+            self.cache.wait_for_refresh(5)
+
+            self.assertEqual([key['kid'] for key in stale['keys']], ['a'])
+            self.assertIsNotNone(self.cache.get_key('b'))
+
+        self.assertEqual(self.cache.stats['refreshes'], 2)
+        self.assertEqual(self.cache.version, 2)
+
+    # an unknown kid should trigger a single throttled refresh
+    def test_unknown_kid_refreshes_once(self):
+        responses = [FakeResponse(jwks_with('a')), FakeResponse(jwks_with('a', 'b'))]
+        with mock.patch('auth.urlopen', side_effect=responses) as urlopen:
+            self.assertIsNone(self.cache.get_key('c'))
+            self.assertIsNone(self.cache.get_key('c'))
+
+        self.assertEqual(urlopen.call_count, 1)
+        self.assertEqual(self.cache.version, 1)
+
+
+class VerifyDecodeJwtTestCase(unittest.TestCase):
+    """This class represents the verify_decode_jwt test case"""
+
+    def setUp(self):
+        cache = auth.JWKSCache(auth.Auth0KeyProvider('example.test'))
+        patches = [
+            mock.patch.object(auth, 'jwks_cache', cache),
+            mock.patch.object(auth, 'token_cache', auth.TokenCache()),
+            mock.patch.object(auth, 'API_AUDIENCE', 'i-buy-local'),
+            mock.patch('auth.urlopen', return_value=FakeResponse(jwks_with('a')))
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    # the public key should be constructed once per key set, not per token
+    def test_public_key_is_constructed_once(self):
+        tokens = {sub: signed_token('a', sub=sub) for sub in ('a', 'b', 'c')}
+        with mock.patch('auth.jwk.construct', wraps=auth.jwk.construct) as construct:
+            for sub, token in tokens.items():
+                payload = auth.verify_decode_jwt(token)
+                self.assertEqual(payload['sub'], sub)
+
+        self.assertEqual(construct.call_count, 1)
+
+    # a token signed by another key should be rejected with a 400
+    def test_bad_signature_is_rejected(self):
+        token = signed_token('a')
+        header, payload, signature = token.split('.')
+        tampered = '.'.join([header, signed_token('a', sub='other').split('.')[1], signature])
+
+        with self.assertRaises(auth.AuthError) as context:
+            auth.verify_decode_jwt(tampered)
+        self.assertEqual(context.exception.status_code, 400)
+
+
+class KeyProviderTestCase(unittest.TestCase):
+    """This class represents the key provider test case"""
+
+    def setUp(self):
+        self.provider = auth.RSAKeypairProvider(audience='i-buy-local', key_size=1024)
+        patches = [
+            mock.patch.object(auth, 'jwks_cache', auth.JWKSCache(self.provider)),
+            mock.patch.object(auth, 'token_cache', auth.TokenCache()),
+            mock.patch.object(auth, 'API_AUDIENCE', 'i-buy-local'),
+            mock.patch('auth.urlopen', side_effect=AssertionError('no network expected'))
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    # tokens minted by the local keypair should verify without any network access
+    def test_minted_token_is_verified_offline(self):
+        token = self.provider.mint_token(['get:businesses'])
+
+        payload = auth.verify_decode_jwt(token)
+        self.assertEqual(payload['permissions'], ['get:businesses'])
+        self.assertTrue(auth.check_permissions('get:businesses', payload))
+
+    # a JWKS file should serve the same keys as the keypair that wrote it
+    def test_jwks_file_provider(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as jwks_file:
+            json.dump(self.provider.fetch()[0], jwks_file)
+        self.addCleanup(os.remove, jwks_file.name)
+        auth.configure_key_provider(auth.JWKSFileProvider(jwks_file.name, issuer=self.provider.issuer))
+
+        payload = auth.verify_decode_jwt(self.provider.mint_token(['get:customers']))
+        self.assertEqual(payload['permissions'], ['get:customers'])
+
+    # the file provider without a file should fail at startup, not on the first request
+    def test_jwks_file_provider_without_file(self):
+        with mock.patch.object(auth, 'AUTH_KEY_PROVIDER', 'file'), mock.patch.object(auth, 'JWKS_FILE', None):
+            with self.assertRaises(RuntimeError):
+                auth._key_provider_from_env()
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        self.cache = auth.TokenCache(maxsize=2)
+        self.payload = {'sub': 'user', 'exp': time.time() + 60}
+
+    # a verified token should be served from the cache until it expires
+    def test_token_is_cached_until_exp(self):
+        self.cache.put('token', self.payload, 1)
+        self.assertEqual(self.cache.get('token', 1), self.payload)
+
+        self.cache.put('expired', {'exp': time.time() - 1}, 1)
+        self.assertIsNone(self.cache.get('expired', 1))
+        self.assertEqual(self.cache.stats['hits'], 1)
+
+    # rotating the signing keys should drop every cached token
+    def test_key_rotation_clears_cache(self):
+        self.cache.put('token', self.payload, 1)
+
+        self.assertIsNone(self.cache.get('token', 2))
+
+    # the least recently used token should be evicted first
+    def test_cache_is_bounded(self):
+        for token in ('a', 'b', 'c'):
+            self.cache.put(token, self.payload, 1)
+
+        self.assertIsNone(self.cache.get('a', 1))
+        self.assertEqual(self.cache.stats['evictions'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
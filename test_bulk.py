@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+
+import bulk
+from models import db, setup_db, Business
+
+
+class BulkInsertTestCase(unittest.TestCase):
+    """This class represents the bulk insert test case"""
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.previous_app = db.app
+        self.app = Flask(__name__)
+        setup_db(self.app, 'sqlite:///' + self.filename)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        db.app = self.previous_app
+        os.remove(self.filename)
+
+    def business(self, i):
+        return {'name': 'bulk{}'.format(i), 'email': 'bulk{}@example.com'.format(i),
+                'address': 'Street {}'.format(i), 'cif': 'bulk_cif{}'.format(i), 'phone': 'bulk_phone{}'.format(i)}
+
+    # a row taken by another writer after the conflict check should only fail that row
+    def test_conflict_after_validation(self):
+        drop_conflicts = bulk.drop_conflicts
+
+        def drop_conflicts_then_race(model, rows, errors):
+            rows = drop_conflicts(model, rows, errors)
+            # another writer wins the name of the second row in the meantime
+            db.session.execute(Business.__table__.insert(), dict(self.business(99), name='bulk1'))
+            db.session.commit()
+            return rows
+
+        with mock.patch.object(bulk, 'drop_conflicts', drop_conflicts_then_race):
+            results = bulk.bulk_insert(Business, [self.business(i) for i in range(3)])
+
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertEqual(results[1]['error'], 'unique constraint violated')
+        names = sorted(name for name, in db.session.query(Business.name))
+        self.assertEqual(names, ['bulk0', 'bulk1', 'bulk2'])
+        self.assertEqual(Business.query.filter_by(name='bulk1').one().email, 'bulk99@example.com')
+
+    # rows without conflicts should be inserted in one go with their ids
+    def test_bulk_insert(self):
+        results = bulk.bulk_insert(Business, [self.business(0), {'name': 'bulk_incomplete'}])
+
+        self.assertEqual(results[0], {'index': 0, 'success': True, 'id': Business.query.one().id})
+        self.assertEqual(results[1]['error'], 'missing email')
+
+
+if __name__ == "__main__":
+    unittest.main()
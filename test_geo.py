@@ -0,0 +1,53 @@
+import math
+import random
+import unittest
+
+import geo
+
+
+class GeohashTestCase(unittest.TestCase):
+    """This class represents the geohash helpers test case"""
+
+    # the encoding should match the reference geohashes
+    def test_geohash_encode(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.geohash_encode(-90, -180, 3), '000')
+
+    # the range of a cell should hold exactly the geohashes starting with it
+    def test_prefix_range(self):
+        self.assertEqual(geo.prefix_range('ezjm9'), ('ezjm9', 'ezjma'))
+        self.assertEqual(geo.prefix_range('ezz'), ('ezz', 'f'))
+        self.assertEqual(geo.prefix_range('zz'), ('zz', None))
+
+    # the cells around a point should contain every point of the circle
+    def test_covering_cells_contain_the_circle(self):
+        rng = random.Random(7)
+        for latitude, longitude, radius in ((40.4168, -3.7038, 5), (69.6, 179.99, 20), (-33.9, 18.4, 0.3)):
+            precision = geo.search_precision(latitude, radius)
+            cells = geo.covering_cells(latitude, longitude, precision)
+            for _ in range(500):
+                # a point at a random bearing on the edge of the circle
+                bearing = rng.uniform(0, 2 * math.pi)
+                delta = radius / geo.EARTH_RADIUS_KM
+                phi1 = math.radians(latitude)
+                phi2 = math.asin(math.sin(phi1) * math.cos(delta) +
+                                 math.cos(phi1) * math.sin(delta) * math.cos(bearing))
+                lambda2 = math.radians(longitude) + math.atan2(
+                    math.sin(bearing) * math.sin(delta) * math.cos(phi1),
+                    math.cos(delta) - math.sin(phi1) * math.sin(phi2))
+                point_longitude = (math.degrees(lambda2) + 180) % 360 - 180
+                code = geo.geohash_encode(math.degrees(phi2), point_longitude, precision)
+                self.assertIn(code, cells)
+
+    # a circle reaching a pole should not use the index
+    def test_search_precision_near_a_pole(self):
+        self.assertEqual(geo.search_precision(89.99, 5), 0)
+
+    # the distance between Madrid and Barcelona is about 505 km
+    def test_haversine_km(self):
+        self.assertAlmostEqual(geo.haversine_km(40.4168, -3.7038, 41.3874, 2.1686), 505.1, places=1)
+        self.assertEqual(geo.haversine_km(10, 10, 10, 10), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+from flask import Flask
+
+from models import db, setup_db, Business, Customer
+from importer import read_rows, chunked, import_rows
+
+
+class ReadRowsTestCase(unittest.TestCase):
+    """This class represents the import file reader test case"""
+
+    def write(self, suffix, text):
+        handle, filename = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as source:
+            source.write(text)
+        self.addCleanup(os.remove, filename)
+        return filename
+
+    # a CSV file should give one dict per line, empty cells left out and numbers kept as strings
+    def test_read_csv(self):
+        path = self.write('.csv', 'name,address,latitude\nAna,Calle Mayor 1,40.41\nLuis,,\n')
+        rows = list(read_rows(path))
+
+        self.assertEqual(rows, [{'name': 'Ana', 'address': 'Calle Mayor 1', 'latitude': '40.41'},
+                                {'name': 'Luis'}])
+
+    # an NDJSON file should give one value per non blank line, whatever its type
+    def test_read_ndjson(self):
+        path = self.write('.ndjson', '{"name": "Ana", "latitude": 40.41}\n\n[1, 2]\n')
+        rows = list(read_rows(path))
+
+        self.assertEqual(rows, [{'name': 'Ana', 'latitude': 40.41}, [1, 2]])
+
+    # the format should be the one given, not the one of the extension
+    def test_read_explicit_format(self):
+        path = self.write('.txt', '{"name": "Ana"}\n')
+
+        self.assertEqual(list(read_rows(path, 'ndjson')), [{'name': 'Ana'}])
+
+    # chunks should hold size rows, the last one the rest
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(6), 3)), [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(list(chunked(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(chunked([], 3)), [])
+
+
+class ImportRowsTestCase(unittest.TestCase):
+    """This class represents the streaming import test case"""
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.previous_app = db.app
+        self.app = Flask(__name__)
+        setup_db(self.app, 'sqlite:///' + self.filename)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        db.app = self.previous_app
+        os.remove(self.filename)
+
+    def customer(self, i):
+        return {'name': 'import{}'.format(i), 'email': 'import{}@example.com'.format(i),
+                'address': 'Street {}'.format(i), 'phone': 'import_phone{}'.format(i)}
+
+    # valid rows should be inserted, invalid ones and unique collisions counted apart
+    def test_import_counts(self):
+        rows = [self.customer(i) for i in range(5)]
+        rows.append(dict(self.customer(0), name='import_repeated_email'))
+        rows.append({'name': 'import_incomplete'})
+        rows.append([1, 2])
+        stats = import_rows(Customer, rows, chunk_size=3)
+
+        self.assertEqual(stats['read'], 8)
+        self.assertEqual(stats['inserted'], 5)
+        self.assertEqual(stats['conflicts'], 1)
+        self.assertEqual(stats['invalid'], 2)
+        self.assertEqual(Customer.query.count(), 5)
+        self.assertEqual(Customer.query.filter_by(name='import0').one().version, 1)
+
+    # numeric strings read from a CSV file should be stored as numbers with the derived geohash
+    def test_import_csv_file(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', encoding='utf-8') as source:
+            source.write('name,email,address,cif,phone,latitude,longitude\n'
+                         'Bakery,bakery@example.com,Calle Mayor 1,B1,600,40.4168,-3.7038\n'
+                         'Florist,florist@example.com,Gran Via 2,B2,601,north,-3.7\n')
+        self.addCleanup(os.remove, path)
+        stats = import_rows(Business, read_rows(path))
+
+        business = Business.query.one()
+        self.assertEqual((stats['inserted'], stats['invalid']), (1, 1))
+        self.assertEqual(business.latitude, 40.4168)
+        self.assertTrue(business.geohash)
+
+    # importing the same file twice should insert nothing the second time
+    def test_import_twice(self):
+        handle, path = tempfile.mkstemp(suffix='.ndjson')
+        with os.fdopen(handle, 'w', encoding='utf-8') as source:
+            for i in range(4):
+                source.write(json.dumps(self.customer(i)) + '\n')
+        self.addCleanup(os.remove, path)
+        first = import_rows(Customer, read_rows(path), chunk_size=2)
+        second = import_rows(Customer, read_rows(path), chunk_size=2)
+
+        self.assertEqual(first['inserted'], 4)
+        self.assertEqual(second['inserted'], 0)
+        self.assertEqual(second['conflicts'], 4)
+        self.assertEqual(Customer.query.count(), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
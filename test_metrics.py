@@ -0,0 +1,72 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import metrics
+import sqltiming
+from metrics import Counter, Histogram, Registry, RequestTimer, timed_phase
+
+
+class MetricsTestCase(unittest.TestCase):
+    """This class represents the request metrics test case"""
+
+    def setUp(self):
+        self.registry = Registry()
+
+    # a histogram should render cumulative buckets, the sum and the count
+    def test_histogram_render(self):
+        histogram = self.registry.register(Histogram('latency_seconds', 'Latency', ('route',), (0.1, 1.0)))
+        histogram.observe(('/a',), 0.05)
+        histogram.observe(('/a',), 0.5)
+        histogram.observe(('/a',), 5)
+        text = self.registry.render()
+
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('route="/a",le="0.1"} 1\n', text)
+        self.assertIn('route="/a",le="1.0"} 2\n', text)
+        self.assertIn('route="/a",le="+Inf"} 3\n', text)
+        self.assertIn('latency_seconds_count{', text)
+
+    # label values should be escaped
+    def test_counter_escapes_labels(self):
+        counter = self.registry.register(Counter('errors_total', 'Errors', ('message',)))
+        counter.inc(('say "hi"\n',), 2)
+
+        self.assertIn('message="say \\"hi\\"\\n"} 2', self.registry.render())
+
+    # a timed function should add its time to the phase of the current request
+    def test_timed_phase(self):
+        encode = timed_phase('serialize')(lambda: 'done')
+        timer = metrics._request.timer = RequestTimer('GET')
+        self.assertEqual(encode(), 'done')
+        timer.finish()
+
+        self.assertGreater(timer.phases['serialize'], 0)
+        self.assertIsNone(metrics._request.timer)
+
+    # outside a timed request a timed function should only run
+    def test_timed_phase_without_timer(self):
+        metrics._request.timer = None
+        encode = timed_phase('serialize')(lambda: 'done')
+
+        self.assertEqual(encode(), 'done')
+
+    # a failing statement should not leave its start time on the pooled connection
+    def test_failed_statement_does_not_leak(self):
+        engine = create_engine('sqlite://')
+        sqltiming.listen(engine, metrics._count_statement)
+        timer = metrics._request.timer = RequestTimer('GET')
+        with engine.connect() as connection:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    connection.execute('SELECT * FROM missing_table')
+            connection.execute('SELECT 1')
+            info = dict(connection.connection.info)
+        metrics._request.timer = None
+
+        self.assertNotIn('sql_timing_start', info)
+        self.assertGreater(timer.statements, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine, inspect
+
+from app import create_app
+import models
+import search
+from models import db, batch, in_batch, projected_query, Business, Customer, Product
+from serializers import serializer_for
+
+
+class BatchTestCase(unittest.TestCase):
+    """This class represents the unit of work test case"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        Business.query.filter(Business.name.like('uow%')).delete(synchronize_session=False)
+        db.session.commit()
+        self.context.pop()
+
+    def business(self, i):
+        return Business(name='uow{}'.format(i), email='uow{}@uow.com'.format(i),
+                        address='address', cif='uow_cif{}'.format(i), phone='uow_phone{}'.format(i))
+
+    # the helpers inside a batch should be committed once on exit
+    def test_batch_commits_on_exit(self):
+        with batch():
+            self.business(1).insert()
+            with batch():
+                self.business(2).insert()
+            self.assertTrue(in_batch())
+            self.assertEqual(len(db.session.new), 2)
+
+        self.assertFalse(in_batch())
+        self.assertEqual(Business.query.filter(Business.name.like('uow%')).count(), 2)
+
+    # an error inside a batch should roll back every staged change
+    def test_batch_rolls_back_on_error(self):
+        with self.assertRaises(ValueError):
+            with batch():
+                self.business(1).insert()
+                raise ValueError()
+
+        self.assertEqual(Business.query.filter(Business.name.like('uow%')).count(), 0)
+
+
+
+class ProjectionTestCase(unittest.TestCase):
+    """This class represents the projected representations test case"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.context = self.app.app_context()
+        self.context.push()
+        business = Business(name='projected', email='projected@projected.com', address='address',
+                            cif='projected_cif', phone='projected_phone', latitude=40.4168, longitude=-3.7038)
+        customer = Customer(name='projected', email='projected@projected.com', address='address',
+                            phone='projected_phone')
+        with batch():
+            business.insert()
+            customer.insert()
+        product = Product(name='projected', price=2.5, available=True, business_id=business.id)
+        product.insert()
+        self.entities = [business, customer, product]
+
+    def tearDown(self):
+        with batch():
+            for entity in reversed(self.entities):
+                entity.delete()
+        self.context.pop()
+
+    # the projected rows of SHORT_FIELDS / LONG_FIELDS should give what short() / long() give
+    def test_projection_matches_model_methods(self):
+        for entity in self.entities:
+            model = type(entity)
+            for view, representation in (('short', entity.short()), ('long', entity.long())):
+                with self.subTest(model=model.__name__, view=view):
+                    serializer = serializer_for(model, view)
+                    row = projected_query(model, serializer.fields).filter(model.id == entity.id).one()
+                    projected = serializer.to_dict(row)
+
+                    self.assertEqual(projected, representation)
+                    self.assertEqual(list(projected), list(representation))
+
+class SearchIndexTestCase(unittest.TestCase):
+    """This class represents the SQLite search index test case"""
+
+    # without the trigram tokenizer (SQLite < 3.34) the tables should be created without the index
+    # and the search should scan with LIKE
+    def test_without_trigram_tokenizer(self):
+        engine = create_engine('sqlite://')
+        with mock.patch.object(models, 'SQLITE_TRIGRAM', False):
+            db.metadata.create_all(engine)
+        self.assertIn('businesses', inspect(engine).get_table_names())
+        self.assertNotIn('businesses_fts', inspect(engine).get_table_names())
+
+        app = create_app()
+        with app.app_context(), mock.patch.object(search, '_has_fts', return_value=False):
+            Business(name='Likebakery', email='like@like.com', address='address', cif='like_cif',
+                     phone='like_phone').insert()
+            try:
+                found = search.search_businesses('KEBAK', ('id', 'name'), 10)
+            finally:
+                Business.query.filter(Business.name == 'Likebakery').delete(synchronize_session=False)
+                db.session.commit()
+
+        self.assertEqual([name for id, name in found], ['Likebakery'])
+
+if __name__ == "__main__":
+    unittest.main()
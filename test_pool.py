@@ -0,0 +1,60 @@
+import sqlite3
+import unittest
+from sqlalchemy.exc import TimeoutError
+
+from pool import InstrumentedQueuePool, engine_options, pool_stats
+
+
+class FakeEngine:
+    def __init__(self, pool):
+        self.pool = pool
+
+
+class PoolTestCase(unittest.TestCase):
+    """This class represents the connection pool test case"""
+
+    def setUp(self):
+        self.pool = InstrumentedQueuePool(lambda: sqlite3.connect(':memory:'),
+                                          pool_size=1, max_overflow=0, timeout=0.05)
+
+    # the pool should report the connections in use and the checkout waits
+    def test_pool_stats(self):
+        connection = self.pool.connect()
+        stats = pool_stats(FakeEngine(self.pool))
+        connection.close()
+        idle = pool_stats(FakeEngine(self.pool))
+
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(idle['in_use'], 0)
+        self.assertEqual(idle['idle'], 1)
+
+    # a checkout that times out should be counted with its wait
+    def test_pool_timeout(self):
+        connection = self.pool.connect()
+        with self.assertRaises(TimeoutError):
+            self.pool.connect()
+        connection.close()
+        stats = pool_stats(FakeEngine(self.pool))
+
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.05)
+
+    # the counters and pre-ping should survive a dispose()
+    def test_recreate_keeps_stats(self):
+        self.pool.connect().close()
+        pool = self.pool.recreate()
+
+        self.assertEqual(pool.wait_stats['checkouts'], 1)
+        self.assertEqual(pool._pre_ping, self.pool._pre_ping)
+
+    # SQLite keeps the pool of SQLAlchemy, PostgreSQL gets the instrumented pool
+    def test_engine_options(self):
+        self.assertEqual(engine_options('sqlite:////tmp/t.db'), {})
+        options = engine_options('postgresql://user@localhost/i_buy_local')
+        self.assertIs(options['poolclass'], InstrumentedQueuePool)
+        self.assertIn('pool_pre_ping', options)
+
+
+if __name__ == "__main__":
+    unittest.main()
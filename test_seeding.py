@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from flask import Flask
+
+from models import db, setup_db, Business, Customer, Product
+from seeding import generate_chunk, seed_database
+
+
+class SeedingTestCase(unittest.TestCase):
+    """This class represents the synthetic data generator test case"""
+
+    # a chunk should only depend on the seed, the table and its position
+    def test_generate_chunk_is_deterministic(self):
+        task = ('businesses', 42, 3, 30, 40, 0, False)
+
+        self.assertEqual(generate_chunk(task), generate_chunk(task))
+        self.assertNotEqual(generate_chunk(task), generate_chunk(('businesses', 43, 3, 30, 40, 0, False)))
+
+    # the unique columns should never repeat and the geohash should be derived
+    def test_generate_chunk_unique_columns(self):
+        rows = generate_chunk(('businesses', 0, 0, 0, 500, 0, False)) + \
+            generate_chunk(('businesses', 0, 1, 500, 1000, 0, False))
+        columns = [column.name for column in Business.__table__.columns]
+
+        for name in ('id', 'name', 'email', 'cif', 'phone'):
+            values = [row[columns.index(name)] for row in rows]
+            self.assertEqual(len(set(values)), len(values))
+        self.assertTrue(all(row[columns.index('geohash')] for row in rows))
+
+    # products should point to existing businesses
+    def test_generate_chunk_products(self):
+        rows = generate_chunk(('products', 0, 0, 0, 200, 7, False))
+        business_id = [column.name for column in Product.__table__.columns].index('business_id')
+
+        self.assertTrue(all(1 <= row[business_id] <= 7 for row in rows))
+
+
+class SeedDatabaseTestCase(unittest.TestCase):
+    """This class represents the database seeding test case"""
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.previous_app = db.app
+        self.app = Flask(__name__)
+        setup_db(self.app, 'sqlite:///' + self.filename)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        db.app = self.previous_app
+        os.remove(self.filename)
+
+    # the tables should hold the requested rows whatever the number of processes
+    def test_seed_database(self):
+        counts = {'businesses': 30, 'customers': 50, 'products': 40}
+        stats = seed_database(counts, seed=1, processes=2)
+
+        self.assertEqual(stats['customers']['rows'], 50)
+        self.assertEqual(Business.query.count(), 30)
+        self.assertEqual(Customer.query.count(), 50)
+        self.assertEqual(Product.query.join(Business).count(), 40)
+        self.assertEqual(Customer.query.get(1).name,
+                         generate_chunk(('customers', 1, 0, 0, 1, 0, False))[0][1])
+
+    # seeding should refuse to mix with existing rows
+    def test_seed_database_not_empty(self):
+        seed_database({'customers': 1}, processes=1)
+
+        with self.assertRaises(ValueError):
+            seed_database({'customers': 1}, processes=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Flask, jsonify
+
+import serializers
+from models import Business, Customer
+from serializers import serializer_for
+
+BACKENDS = [('json', serializers._stdlib_dumps)]
+if serializers.orjson is not None:
+    BACKENDS.append(('orjson', serializers._orjson_dumps))
+
+
+class SerializersTestCase(unittest.TestCase):
+    """This class represents the response encoding test case"""
+
+    def setUp(self):
+        # jsonify as the routes used it, without the key sorting, the ASCII escapes
+        # and the trailing newline that dumps never added
+        self.app = Flask(__name__)
+        self.app.config['JSON_SORT_KEYS'] = False
+        self.app.config['JSON_AS_ASCII'] = False
+        self.app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+
+    def jsonify(self, body):
+        with self.app.test_request_context():
+            return jsonify(body).get_data().rstrip(b'\n')
+
+    def business(self):
+        return Business(id=7, name='Panadería Sol', email='sol@example.com', phone='600', address='Calle Mayor 1',
+                        cif='B1', latitude=40.4168, longitude=None, version=2)
+
+    # the serializers should keep the fields of the model views in their order
+    def test_field_order(self):
+        business = self.business()
+        row = tuple(getattr(business, field) for field in Business.LONG_FIELDS)
+        long = serializer_for(Business, 'long').to_dict(row)
+
+        self.assertEqual(list(long), list(business.long()))
+        self.assertEqual(long, business.long())
+        self.assertEqual(serializer_for(Customer, 'short').fields, Customer.SHORT_FIELDS)
+        self.assertIs(serializer_for(Business, 'long'), serializer_for(Business, 'long'))
+
+    # both backends should give the bytes of jsonify for the representations of the routes
+    def test_same_bytes_as_jsonify(self):
+        business = self.business()
+        body = {'success': True, 'businesses': [business.short()], 'business': business.long(),
+                'updated': datetime(2026, 10, 18, 9, 30), 'opened': date(2020, 1, 2), 'next': None, 'status': 200}
+        expected = self.jsonify(body)
+        for name, dumps in BACKENDS:
+            with self.subTest(backend=name):
+                self.assertEqual(dumps(body), expected)
+
+    # None, Decimal and datetime values should be encoded the same way by both backends
+    def test_special_values(self):
+        body = {'price': Decimal('9.50'), 'available': None, 'at': datetime(2026, 10, 18, 9, 30, 5)}
+        for name, dumps in BACKENDS:
+            with self.subTest(backend=name):
+                self.assertEqual(dumps(body),
+                                 b'{"price":9.5,"available":null,"at":"Sun, 18 Oct 2026 09:30:05 GMT"}')
+
+    # values without a JSON form should still fail loudly
+    def test_unknown_type(self):
+        for name, dumps in BACKENDS:
+            with self.subTest(backend=name):
+                with self.assertRaises(TypeError):
+                    dumps({'value': object()})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from slowlog import SlowQueryLog, redact
+
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    """This class represents the slow query log test case"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.engine.execute('CREATE TABLE customers (id INTEGER PRIMARY KEY, email TEXT)')
+        self.log = SlowQueryLog(threshold_ms=0, size=2)
+        self.log.install(self.engine)
+
+    # a slow statement should be recorded with its redacted parameters and its plan
+    def test_records_statement_and_plan(self):
+        self.engine.execute('SELECT id FROM customers WHERE email = ?', ('ana@example.com',))
+        entry = self.log.entries()[0]
+
+        self.assertIn('FROM customers', entry['statement'])
+        self.assertEqual(entry['parameters'], ['<str 15>'])
+        self.assertEqual(entry['explain'], 'EXPLAIN QUERY PLAN')
+        self.assertTrue(any('customers' in line for line in entry['plan']))
+        self.assertIsNone(entry['route'])
+
+    # only the last entries should be kept, newest first
+    def test_ring_buffer(self):
+        for id in range(3):
+            self.engine.execute('SELECT id FROM customers WHERE id = ?', (id,))
+        entries = self.log.entries()
+
+        self.assertEqual([entry['parameters'] for entry in entries], [[2], [1]])
+
+    # a failing statement should not leave its start time on the pooled connection
+    def test_failed_statement_does_not_leak(self):
+        with self.engine.connect() as connection:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    connection.execute('SELECT * FROM missing_table')
+            connection.execute('SELECT 1')
+            info = dict(connection.connection.info)
+
+        self.assertNotIn('sql_timing_start', info)
+
+    # statements under the threshold should not be recorded
+    def test_threshold(self):
+        self.log.threshold_ms = 60000
+        self.engine.execute('SELECT 1')
+
+        self.assertEqual(self.log.entries(), [])
+
+    # numbers should be kept and everything else redacted
+    def test_redact(self):
+        self.assertEqual(redact({'id': 3, 'email': 'ana@example.com', 'data': b'xy', 'ok': None}),
+                         {'id': 3, 'email': '<str 15>', 'data': '<bytes 2>', 'ok': None})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import re
+from flask import request, abort
+from sqlalchemy import and_, exists, select
+
+from models import db
+
+# "3": the version of the row, If-Match uses the strong comparison (RFC 7232 3.1)
+# so weak tags (W/"3") never match and are skipped like any other foreign tag
+_ENTITY_TAG = re.compile(r'^"(\d+)"$')
+
+
+'''
+if_match_version()
+    the versions accepted by the If-Match header of the current request
+    return None when there is no header or it is *, any version is then accepted
+    aborts with 412 when no tag of the header can be a version (it would never match)
+    EXAMPLE
+        If-Match: "3"  ->  [3]
+'''
+def if_match_version():
+    header = request.headers.get('If-Match')
+    if header is None or header.strip() == '*':
+        return None
+    versions = []
+    for tag in header.split(','):
+        match = _ENTITY_TAG.match(tag.strip())
+        if match is not None:
+            versions.append(int(match.group(1)))
+    if not versions:
+        abort(412)
+    return versions
+
+
+'''
+etag(version)
+    the ETag header value of a row version
+'''
+def etag(version):
+    return '"{}"'.format(version)
+
+
+'''
+update_returning(model, id, values, versions, fields)
+    writes values into the row id and bumps its version with a single UPDATE,
+    only when the version is one of versions (any version when None)
+    PostgreSQL: UPDATE ... RETURNING, other databases: UPDATE then a SELECT of
+                the row in the same transaction (no RETURNING in SQLAlchemy 1.3)
+    the transaction is committed, or rolled back when no row was updated
+    return the fields of the updated row as a dict, None when the row does not exist
+    aborts with 412 when the row exists with another version
+    EXAMPLE
+        business = update_returning(Business, 7, {'phone': '555'}, if_match_version(), Business.LONG_FIELDS)
+'''
+def update_returning(model, id, values, versions, fields):
+    table = model.__table__
+    condition = _row_condition(table, id, versions)
+    statement = table.update().where(condition).values(dict(values, version=table.c.version + 1))
+    columns = [table.c[name] for name in fields]
+    if db.engine.dialect.name == 'postgresql':
+        row = db.session.execute(statement.returning(*columns)).first()
+    else:
+        row = None
+        if db.session.execute(statement).rowcount == 1:
+            row = db.session.execute(select(columns).where(table.c.id == id)).first()
+
+    if row is None:
+        db.session.rollback()
+        _abort_on_conflict(table, id, versions)
+        return None
+    db.session.commit()
+    return dict(zip(fields, row))
+
+
+'''
+delete_returning(model, id, versions, cascade)
+    deletes the row id with a single DELETE (RETURNING on PostgreSQL), only when
+    its version is one of versions (any version when None)
+    cascade: foreign key columns of the child rows deleted with it (e.g. Product.business_id),
+    the core DELETE does not go through the cascade of the ORM relationships
+    return the ids of the deleted child rows per cascade column, the caller invalidates
+    their cached entities, or None when the row does not exist
+    aborts with 412 when the row exists with another version
+    EXAMPLE
+        children = delete_returning(Business, 7, None, cascade=(Product.business_id,))
+        product_ids = children[Product.business_id]
+'''
+def delete_returning(model, id, versions, cascade=()):
+    table = model.__table__
+    condition = _row_condition(table, id, versions)
+    postgres = db.engine.dialect.name == 'postgresql'
+    children = {}
+    for column in cascade:
+        child_table = column.table
+        child_condition = column == id
+        if versions is not None:
+            # the children only go when the parent does
+            child_condition = and_(child_condition, exists().where(condition))
+        if postgres:
+            children[column] = [child_id for child_id, in db.session.execute(
+                child_table.delete().where(child_condition).returning(child_table.c.id))]
+        else:
+            children[column] = [child_id for child_id, in db.session.execute(
+                select([child_table.c.id]).where(child_condition))]
+            db.session.execute(child_table.delete().where(child_condition))
+
+    statement = table.delete().where(condition)
+    if postgres:
+        deleted = db.session.execute(statement.returning(table.c.id)).first() is not None
+    else:
+        deleted = db.session.execute(statement).rowcount == 1
+
+    if not deleted:
+        db.session.rollback()
+        _abort_on_conflict(table, id, versions)
+        return None
+    db.session.commit()
+    return children
+
+
+def _row_condition(table, id, versions):
+    if versions is None:
+        return table.c.id == id
+    return and_(table.c.id == id, table.c.version.in_(versions))
+
+
+def _abort_on_conflict(table, id, versions):
+    # only failed conditional writes pay for this lookup
+    if versions is not None and db.session.execute(select([table.c.id]).where(table.c.id == id)).first():
+        abort(412)
@@ -0,0 +1,63 @@
+'''
+wsgi
+    production entry point, served by gunicorn with the settings of gunicorn.conf.py
+    RUN
+        gunicorn wsgi:app
+    with GUNICORN_WORKER_CLASS=gevent the application comes from gevent_app, which
+    patches the standard library before anything is imported (the app is preloaded
+    in the master, before the gevent workers would patch it themselves)
+'''
+import os
+import logging
+from werkzeug.exceptions import HTTPException
+
+if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent':
+    from gevent_app import app
+else:
+    from app import app
+
+from auth import jwks_cache
+from models import db
+
+# gunicorn serves wsgi:app
+__all__ = ['app', 'warm_up']
+
+logger = logging.getLogger(__name__)
+
+# first pages built before the workers take traffic: it loads the code, the serializers and
+# the SQL of the listings, the pages themselves only outlive LISTING_CACHE_TTL seconds
+WARM_UP_LISTINGS = ('get_businesses', 'get_customers')
+
+
+'''
+warm_up(flask_app)
+    fetches the signing keys and builds the first page of the hot listings
+    with a preloaded app it runs once in the master and the workers inherit the
+    key set through copy-on-write (it is cached for minutes); the listing pages
+    have usually expired by then, building them still primes the lazy imports,
+    the compiled statements and the serializers of the listing routes
+    failures are logged, a cold cache only makes the first requests slower
+    the database connections it opened are closed again, they must not be
+    shared by the forked workers
+'''
+def warm_up(flask_app):
+    try:
+        jwks_cache.get()
+    except Exception:
+        logger.warning('could not fetch the signing keys', exc_info=True)
+
+    for endpoint in WARM_UP_LISTINGS:
+        view = flask_app.view_functions[endpoint]
+        with flask_app.test_request_context():
+            try:
+                # the route itself, below requires_auth
+                view.__wrapped__(None)
+            except HTTPException:
+                # an empty listing answers 404, nothing to cache
+                pass
+            except Exception:
+                logger.warning('could not warm up %s', endpoint, exc_info=True)
+
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()